@@ -347,12 +347,31 @@ class Snap_ToGround_Surface(Operator):
         return {'FINISHED'}
 
 
+class Make_Single_User_Materials(Operator):
+    bl_idname = "object.make_single_user_materials"
+    bl_label = "Make Materials Single User"
+    bl_description = "Make materials of selected copy-on-write assets single-user before editing them"
+
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context: bpy.types.Context):
+        return context.mode == 'OBJECT' and len(context.selected_objects) > 0
+
+    def execute(self, context):
+        polib.asset_addon.resolve_copy_on_write_objects(
+            context.selected_objects, polib.asset_addon.CopyOnWriteDataKind.MATERIAL)
+
+        return {'FINISHED'}
+
+
 
 
 
 #####################################################   draw   ###################################################    
 
-operators_object = ["object.add_empty_at_loc", "object.snap_toground", "object.snap_toground_surface"]
+operators_object = ["object.add_empty_at_loc", "object.snap_toground", "object.snap_toground_surface",
+                    "object.make_single_user_materials"]
 
 operators_edit = ["object.add_empty_at_loc", "object.set_origin_to_selected"]
       
@@ -469,6 +488,7 @@ classes = (
     Set_Origin_To_sel,
     Snap_ToGround,
     Snap_ToGround_Surface,
+    Make_Single_User_Materials,
     
     Quick_Addons,
     DrawPie,
@@ -499,8 +519,10 @@ def register():
             
     
     addon_updater_ops.register(bl_info)
+    polib.register()
             
 def unregister():    
+    polib.unregister()
     for cls in classes:
         bpy.utils.unregister_class(cls)
         
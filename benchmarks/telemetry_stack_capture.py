@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+# Compares per-call cost of eager stack formatting, which telemetry used before, with lazy stack
+# capture of LazyStack and measures TelemetryWrapper.log_warning both ways.
+#
+# blender --background --python benchmarks/telemetry_stack_capture.py
+
+import contextlib
+import io
+import os
+import sys
+import timeit
+import traceback
+import typing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "polib"))
+import telemetry_module  # noqa: E402
+
+
+DEPTH = 30
+REPEAT = 2000
+
+
+def call_at_depth(remaining: int, fn: typing.Callable[[], typing.Any]) -> typing.Any:
+    if remaining == 0:
+        return fn()
+    return call_at_depth(remaining - 1, fn)
+
+
+def measure(name: str, fn: typing.Callable[[], typing.Any]) -> None:
+    # log_* methods print to console depending on VERBOSE_LEVEL
+    with contextlib.redirect_stdout(io.StringIO()):
+        seconds = timeit.timeit(lambda: call_at_depth(DEPTH, fn), number=REPEAT)
+    print(f"{name}: {seconds / REPEAT * 1e6:.1f} us per call at depth {DEPTH}")
+
+
+def log_warning_eager(telemetry: telemetry_module.TelemetryWrapper, message: str) -> None:
+    """log_warning as it was before LazyStack, the stack is formatted on every call"""
+    telemetry.log(
+        telemetry_module.Message(
+            telemetry_module.MessageType.WARNING_MESSAGE,
+            data=[message] + traceback.extract_stack().format(),
+            product=telemetry.product
+        )
+    )
+    if telemetry_module.VERBOSE_LEVEL <= telemetry_module.VerboseLevel.WARNING:
+        print(f"WARNING[{telemetry.product}]: {message}")
+
+
+def main() -> None:
+    measure("traceback.extract_stack().format()", lambda: traceback.extract_stack().format())
+    measure("LazyStack()", lambda: telemetry_module.LazyStack())
+    measure("LazyStack().format()", lambda: telemetry_module.LazyStack().format())
+
+    telemetry = telemetry_module.get_telemetry("benchmark")
+    for level in (telemetry_module.VerboseLevel.NONE, telemetry_module.VerboseLevel.WARNING):
+        telemetry_module.VERBOSE_LEVEL = level
+        measure(
+            f"log_warning before, VERBOSE_LEVEL={level.name}",
+            lambda: log_warning_eager(telemetry, "benchmark")
+        )
+        measure(
+            f"log_warning after, VERBOSE_LEVEL={level.name}",
+            lambda: telemetry.log_warning("benchmark")
+        )
+
+
+main()
@@ -10,15 +10,24 @@ if "asset_addon" not in locals():
     from . import utils
     from . import ui
     from . import snap_to_ground
+    from . import scene_index
+    from . import scatter
+    from . import data_hash
 
 else:
     import importlib
     asset_addon = importlib.reload(asset_addon)
     linalg = importlib.reload(linalg)
+    # reloading resets the module globals, the running sink would be left without anyone to
+    # flush and stop it
+    telemetry_native_module.stop_sink()
     telemetry_native_module = importlib.reload(telemetry_native_module)
     utils = importlib.reload(utils)
     ui = importlib.reload(ui)
     snap_to_ground = importlib.reload(snap_to_ground)
+    scene_index = importlib.reload(scene_index)
+    scatter = importlib.reload(scatter)
+    data_hash = importlib.reload(data_hash)
 
 
 # fake bl_info so that this gets picked up by vscode blender integration
@@ -57,4 +66,16 @@ def get_telemetry(product: str):
     return telemetry_module.get_telemetry(product)
 
 
-__all__ = ["asset_addon", "get_telemetry", "linalg", "utils", "ui", "snap_to_ground"]
+def register():
+    """Registers handlers of polib modules, call it from register() of the addon"""
+    scene_index.register()
+    asset_addon.register()
+
+
+def unregister():
+    """Removes handlers of polib modules, call it from unregister() of the addon"""
+    asset_addon.unregister()
+    scene_index.unregister()
+
+
+__all__ = ["asset_addon", "get_telemetry", "register", "unregister", "linalg", "utils", "ui", "snap_to_ground", "scene_index", "scatter", "data_hash"]
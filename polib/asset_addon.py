@@ -3,12 +3,14 @@
 
 import bpy
 import bpy.utils.previews
-import bmesh
+import mathutils
+import numpy
 import os
 import os.path
 import typing
 import collections
 import enum
+import functools
 import logging
 logger = logging.getLogger(__name__)
 
@@ -17,11 +19,15 @@ if "linalg" not in locals():
     from . import linalg
     from . import utils
     from . import rigs_shared
+    from . import scene_index
+    from . import data_hash
 else:
     import importlib
     linalg = importlib.reload(linalg)
     utils = importlib.reload(utils)
     rigs_shared = importlib.reload(rigs_shared)
+    scene_index = importlib.reload(scene_index)
+    data_hash = importlib.reload(data_hash)
 
 
 PARTICLE_SYSTEM_PREFIX = "pps_"
@@ -187,10 +193,19 @@ def list_asset_previews(
     return ret
 
 
-def get_all_object_ancestors(obj: bpy.types.Object) -> typing.Set[bpy.types.Object]:
+def get_all_object_ancestors(
+    obj: bpy.types.Object,
+    hierarchy_index: typing.Optional[scene_index.HierarchyIndex] = None
+) -> typing.Set[bpy.types.Object]:
     """Returns given object's parent, the parent's parent, ...
+
+    Callers querying many objects pass one 'hierarchy_index' created for the call, a single
+    object walks obj.parent, which only visits its ancestors.
     """
 
+    if hierarchy_index is not None:
+        return set(hierarchy_index.get_ancestors(obj))
+
     ret = set()
     current = obj.parent
     while current is not None:
@@ -211,16 +226,8 @@ def filter_out_descendants_from_objects(
     body, not all objects.
     """
 
-    all_objects = set(objects)
-
-    ret = set()
-    for obj in objects:
-        ancestors = get_all_object_ancestors(obj)
-        if len(all_objects.intersection(ancestors)) == 0:
-            # this object has no ancestors that are also contained in objects
-            ret.add(obj)
-
-    return ret
+    # one snapshot for all objects, its intervals answer ancestry without walking parents
+    return scene_index.HierarchyIndex().filter_roots(objects)
 
 
 def is_polygoniq_object(
@@ -238,11 +245,13 @@ def is_polygoniq_object(
         # in most cases there will be exactly one linked object but we want to play it
         # safe and will check all of them. if any linked object is a polygoniq object
         # we assume the whole instance collection is
-        for linked_obj in obj.instance_collection.objects:
-            if is_polygoniq_object(linked_obj, addon_name):
-                return True
+        addon_names = scene_index.collection_classification_cache.get_addon_names(
+            obj.instance_collection)
+        if addon_name is None:
+            return len(addon_names) > 0
+        return addon_name in addon_names
 
-        return False
+    return False
 
 
 def find_polygoniq_root_objects(
@@ -258,6 +267,15 @@ def find_polygoniq_root_objects(
 
     traversed_objects = set()
     root_objects = set()
+    # each object is classified only once even though we ask about it as child and as parent
+    classified_objects = {}
+
+    def is_polygoniq(obj: bpy.types.Object) -> bool:
+        ret = classified_objects.get(obj, None)
+        if ret is None:
+            ret = bool(is_polygoniq_object(obj, addon_name))
+            classified_objects[obj] = ret
+        return ret
 
     for obj in objects:
         if obj in traversed_objects:
@@ -269,11 +287,11 @@ def find_polygoniq_root_objects(
                 break
 
             if current_obj.parent is None:
-                if is_polygoniq_object(current_obj, addon_name):
+                if is_polygoniq(current_obj):
                     root_objects.add(current_obj)
                 break
 
-            if is_polygoniq_object(current_obj, addon_name) and not is_polygoniq_object(current_obj.parent, addon_name):
+            if is_polygoniq(current_obj) and not is_polygoniq(current_obj.parent):
                 root_objects.add(current_obj)
                 break
 
@@ -296,6 +314,42 @@ def get_polygoniq_objects(
             yield obj
 
 
+def get_all_polygoniq_objects(
+    addon_name: typing.Optional[str] = None,
+    include_editable: bool = True,
+    include_linked: bool = True
+) -> typing.List[bpy.types.Object]:
+    """Returns all objects in bpy.data.objects for which is_polygoniq_object is True.
+
+    Same as get_polygoniq_objects(bpy.data.objects, ...), but it queries
+    scene_index.polygoniq_property_index instead of scanning all objects.
+    """
+    property_index = scene_index.polygoniq_property_index
+    ret = []
+    if include_editable:
+        addon_names = property_index.get_values("polygoniq_addon") \
+            if addon_name is None else [addon_name]
+        for name in addon_names:
+            ret.extend(property_index.get_objects("polygoniq_addon", name))
+
+    if include_linked:
+        for collection in property_index.get_values(scene_index.INSTANCE_COLLECTION_KEY):
+            instancers = property_index.get_objects(scene_index.INSTANCE_COLLECTION_KEY, collection)
+            if include_editable:
+                # objects with polygoniq_addon property are classified by it even if they
+                # instance a collection
+                instancers = [obj for obj in instancers if obj.get("polygoniq_addon", None) is None]
+            if len(instancers) > 0 and is_polygoniq_object(instancers[0], addon_name, False, True):
+                ret.extend(instancers)
+
+    return ret
+
+
+def get_objects_from_blend(blend_path: str) -> typing.List[bpy.types.Object]:
+    """Returns editable objects converted from asset with given 'polygoniq_addon_blend_path'"""
+    return scene_index.polygoniq_property_index.get_objects("polygoniq_addon_blend_path", blend_path)
+
+
 def get_addon_install_path(addon_name: str) -> typing.Optional[str]:
     addon = bpy.context.preferences.addons.get(addon_name, None)
     if addon is None:
@@ -427,17 +481,22 @@ def get_entire_object_hierachy(obj: bpy.types.Object) -> typing.Iterable[bpy.typ
 
     Example: If you pass a traffiq car object it will return body, wheels and lights.
     """
-    ret = []
-    for child in obj.children:
-        ret.extend(get_entire_object_hierachy(child))
+    hierarchy_index = scene_index.HierarchyIndex()
 
-    if obj.instance_type == 'COLLECTION':
-        for col_obj in obj.instance_collection.objects:
-            ret.append(col_obj)
-    else:
-        ret.append(obj)
+    def get_object_hierarchy(obj: bpy.types.Object) -> typing.List[bpy.types.Object]:
+        ret = []
+        for child in hierarchy_index.get_children(obj):
+            ret.extend(get_object_hierarchy(child))
 
-    return ret
+        if obj.instance_type == 'COLLECTION':
+            for col_obj in obj.instance_collection.objects:
+                ret.append(col_obj)
+        else:
+            ret.append(obj)
+
+        return ret
+
+    return get_object_hierarchy(obj)
 
 
 def decompose_traffiq_vehicle(obj: bpy.types.Object) -> DecomposedCarType:
@@ -536,6 +595,83 @@ def create_instanced_object(collection_name: str) -> bpy.types.Object:
     return instance_obj
 
 
+def create_instanced_objects(
+    collection_name: str,
+    target_collection: bpy.types.Collection,
+    matrices: typing.Optional[numpy.ndarray] = None,
+    locations: typing.Optional[numpy.ndarray] = None,
+    rotations: typing.Optional[numpy.ndarray] = None,
+    scales: typing.Optional[numpy.ndarray] = None,
+    color: typing.Optional[typing.Tuple[float, float, float, float]] = None
+) -> typing.List[bpy.types.Object]:
+    """Creates many instances of collection 'collection_name' and links them to 'target_collection'.
+
+    Batch version of create_instanced_object followed by collection_add_object. Transforms are
+    given either by (N, 4, 4) array of 'matrices' or by (N, 3) arrays of 'locations', XYZ euler
+    'rotations' and 'scales', missing arrays default to identity. Instances get 'color', color
+    of the first object in the collection if not given. Instances are first linked to a temporary
+    collection, transforms and colors are written with foreach_set on it, so objects already
+    in 'target_collection' are neither read nor written.
+    """
+
+    assert collection_name in bpy.data.collections
+    if matrices is not None:
+        assert locations is None and rotations is None and scales is None
+        locations, rotations, scales = linalg.decompose_matrices(matrices)
+
+    count = next((len(array) for array in (locations, rotations, scales) if array is not None), 0)
+    if count == 0:
+        return []
+
+    if locations is None:
+        locations = numpy.zeros((count, 3))
+    if rotations is None:
+        rotations = numpy.zeros((count, 3))
+    if scales is None:
+        scales = numpy.ones((count, 3))
+
+    collection = bpy.data.collections[collection_name]
+    if color is None:
+        # take object color from the first object in the collection
+        # this is necessary for botaniq's seasons
+        color = next((tuple(obj.color) for obj in collection.all_objects), (1.0, 1.0, 1.0, 1.0))
+
+    temporary_collection = bpy.data.collections.new(f"temp_{collection_name}")
+    try:
+        instance_objs = []
+        for _ in range(count):
+            instance_obj = bpy.data.objects.new(collection_name, None)
+            instance_obj.instance_type = 'COLLECTION'
+            instance_obj.instance_collection = collection
+            temporary_collection.objects.link(instance_obj)
+            instance_objs.append(instance_obj)
+
+        temporary_objects = temporary_collection.objects
+        if temporary_objects[0] == instance_objs[0] and temporary_objects[-1] == instance_objs[-1]:
+            # objects of the temporary collection are exactly the instances in creation order
+            for attribute, values in (
+                ("location", locations),
+                ("rotation_euler", rotations),
+                ("scale", scales),
+                ("color", numpy.tile(color, (count, 1)))
+            ):
+                temporary_objects.foreach_set(
+                    attribute, numpy.asarray(values, dtype=numpy.float32).ravel())
+        else:
+            for instance_obj, location, rotation, scale in zip(instance_objs, locations, rotations, scales):
+                instance_obj.location = location
+                instance_obj.rotation_euler = rotation
+                instance_obj.scale = scale
+                instance_obj.color = color
+
+        for instance_obj in instance_objs:
+            target_collection.objects.link(instance_obj)
+    finally:
+        bpy.data.collections.remove(temporary_collection)
+
+    return instance_objs
+
+
 def traffiq_link_asset(
         context: bpy.types.Context,
         asset_name: str,
@@ -631,6 +767,8 @@ def make_selection_linked(context: bpy.types.Context, telemetry):
     previous_active_object_name = context.active_object.name if context.active_object else None
 
     converted_objects = []
+    # one allocator for all renamed objects, similarly named objects don't probe suffixes again
+    name_allocator = utils.UniqueNameAllocator(bpy.data.objects)
     for obj in find_polygoniq_root_objects(context.selected_objects):
         if obj.instance_type == 'COLLECTION':
             continue
@@ -677,8 +815,7 @@ def make_selection_linked(context: bpy.types.Context, telemetry):
         # This way old object names won't interfere with the new ones
         hierarchy_objects = get_hierarchy(obj)
         for hierarchy_obj in hierarchy_objects:
-            hierarchy_obj.name = utils.generate_unique_name(
-                f"del_{hierarchy_obj.name}", bpy.data.objects)
+            hierarchy_obj.name = name_allocator.allocate(f"del_{hierarchy_obj.name}")
 
         if addon_property == "traffiq":
             if can_asset_change_color(obj):
@@ -733,19 +870,624 @@ def make_selection_linked(context: bpy.types.Context, telemetry):
     return converted_objects
 
 
-def make_selection_editable(context: bpy.types.Context, delete_base_empty: bool, keep_selection: bool = True, keep_active: bool = True) -> typing.List[str]:
-    def apply_botaniq_particle_system_modifiers(obj: bpy.types.Object):
+def has_animation_data(id_data: bpy.types.ID) -> bool:
+    """Returns True if 'id_data' has an action, NLA tracks or drivers"""
+    animation_data = getattr(id_data, "animation_data", None)
+    if animation_data is None:
+        return False
+    return animation_data.action is not None or len(animation_data.nla_tracks) > 0 or \
+        len(animation_data.drivers) > 0
+
+
+def get_hierarchy_fingerprint(
+    root_obj: bpy.types.Object,
+    memo: data_hash.HashMemo,
+    mesh_hashes: typing.Dict[typing.Tuple[bpy.types.Mesh, bool], str],
+    precision: int = 4,
+    hierarchy_index: typing.Optional[scene_index.HierarchyIndex] = None
+) -> typing.Optional[str]:
+    """Returns hash of 'root_obj' hierarchy that is the same for hierarchies that would look
+    the same if placed at the same 'matrix_world'.
+
+    Hashed are transforms relative to the root rounded to 'precision' decimals, parenting, mesh
+    geometry, structure of materials, modifiers, armature poses, custom properties and identity
+    of other object data. Hashes of materials and node trees are stored in 'memo', hashes of
+    meshes in 'mesh_hashes'. Bulk callers pass 'hierarchy_index' created for the call, otherwise
+    the hierarchy is walked through obj.children.
+
+    Returns None if any object of the hierarchy has constraints, animation data or drivers,
+    these can depend on objects outside of the hierarchy and the hierarchy can't be instanced.
+    """
+    if hierarchy_index is not None:
+        hierarchy = hierarchy_index.get_subtree(root_obj)
+    else:
+        hierarchy = get_hierarchy(root_obj)
+    obj_indices = {obj: i for i, obj in enumerate(hierarchy)}
+    root_inverse = root_obj.matrix_world.inverted_safe()
+    fingerprint = []
+    for i, obj in enumerate(hierarchy):
+        if len(obj.constraints) > 0 or has_animation_data(obj) or \
+                (obj.data is not None and has_animation_data(obj.data)) or \
+                (obj.type == 'MESH' and obj.data.shape_keys is not None and
+                 has_animation_data(obj.data.shape_keys)):
+            return None
+
+        pose_signature = None
+        if obj.pose is not None:
+            pose_signature = []
+            for pose_bone in obj.pose.bones:
+                if len(pose_bone.constraints) > 0:
+                    return None
+                pose_signature.append((
+                    pose_bone.name,
+                    tuple(round(value, precision) + 0.0
+                          for row in pose_bone.matrix_basis for value in row),
+                    data_hash.get_custom_properties_hash(pose_bone)
+                ))
+            pose_signature = tuple(pose_signature)
+
+        if obj.type == 'MESH':
+            include_vertex_weights = len(obj.vertex_groups) > 0
+            key = (obj.data, include_vertex_weights)
+            data_signature = mesh_hashes.get(key, None)
+            if data_signature is None:
+                data_signature = data_hash.get_mesh_hash(obj.data, include_vertex_weights)
+                mesh_hashes[key] = data_signature
+        elif obj.data is not None:
+            data_signature = (type(obj.data).__name__, obj.data.name_full)
+        else:
+            data_signature = None
+
+        relative_matrix = root_inverse @ obj.matrix_world
+        fingerprint.append((
+            obj.type,
+            data_signature,
+            obj_indices.get(obj.parent, -1) if i > 0 else -1,
+            obj.parent_type,
+            obj.parent_bone,
+            # adding 0.0 turns -0.0 into 0.0, these have different repr
+            tuple(round(value, precision) + 0.0 for row in relative_matrix for value in row),
+            tuple(
+                (slot.link, data_hash.get_material_hash(slot.material, memo)
+                 if slot.material is not None else None)
+                for slot in obj.material_slots
+            ),
+            data_hash.get_modifiers_hash(obj, memo),
+            tuple(group.name for group in obj.vertex_groups),
+            obj.instance_type,
+            obj.instance_collection.name_full if obj.instance_collection is not None else None,
+            tuple(round(value, precision) + 0.0 for value in obj.color),
+            obj.hide_render,
+            obj.display_type,
+            pose_signature,
+            data_hash.get_custom_properties_hash(obj)
+        ))
+
+    return data_hash.hash_signature(tuple(fingerprint))
+
+
+def make_identical_hierarchies_instanced(
+    objects: typing.Iterable[bpy.types.Object],
+    min_count: int = 2
+) -> typing.List[bpy.types.Object]:
+    """Replaces hierarchies in 'objects' that occur at least 'min_count' times with instances.
+
+    Hierarchies are grouped by get_hierarchy_fingerprint, hierarchies that can't be fingerprinted
+    and hierarchies whose root isn't in any collection are skipped. The first hierarchy of each
+    group is moved to a new collection, which isn't linked to any scene, with its root at
+    the origin. Every occurrence is replaced by a collection instance empty with the same world
+    matrix, parent, collections and color as its root, other occurrences are removed. Returns
+    the created instances.
+    """
+    memo: data_hash.HashMemo = {}
+    mesh_hashes = {}
+    groups: typing.Dict[str, typing.List[bpy.types.Object]] = collections.OrderedDict()
+    # hierarchies are collected before any reparenting makes the hierarchy index stale
+    hierarchy_index = scene_index.HierarchyIndex()
+    subtrees: typing.Dict[bpy.types.Object, typing.List[bpy.types.Object]] = {}
+    for root_obj in hierarchy_index.filter_roots(objects):
+        if root_obj.instance_type == 'COLLECTION' or root_obj.library is not None:
+            continue
+        if len(root_obj.users_collection) == 0:
+            # there is no collection to link the instance to
+            continue
+        fingerprint = get_hierarchy_fingerprint(
+            root_obj, memo, mesh_hashes, hierarchy_index=hierarchy_index)
+        if fingerprint is None:
+            continue
+        groups.setdefault(fingerprint, []).append(root_obj)
+        subtrees[root_obj] = hierarchy_index.get_subtree(root_obj)
+
+    ret = []
+    to_remove = []
+    for roots in groups.values():
+        if len(roots) < min_count:
+            continue
+        # keep the order stable across runs
+        roots.sort(key=lambda obj: obj.name)
+
+        # occurrences are grouped by their first collection, each group is created in one batch
+        occurrences: typing.Dict[bpy.types.Collection, typing.List[bpy.types.Object]] = \
+            collections.OrderedDict()
+        for root_obj in roots:
+            occurrences.setdefault(root_obj.users_collection[0], []).append(root_obj)
+        occurrence_transforms = {
+            root_obj: (
+                root_obj.matrix_world.copy(),
+                root_obj.parent,
+                root_obj.matrix_parent_inverse.copy(),
+                root_obj.matrix_basis.copy(),
+                list(root_obj.users_collection)
+            )
+            for root_obj in roots
+        }
+
+        representative = roots[0]
+        # color is part of the fingerprint, all roots in the group have the same
+        color = tuple(representative.color)
+        instance_collection = bpy.data.collections.new(
+            utils.remove_object_duplicate_suffix(representative.name))
+        for obj in subtrees[representative]:
+            for collection in obj.users_collection:
+                collection.objects.unlink(obj)
+            instance_collection.objects.link(obj)
+        representative.parent = None
+        representative.matrix_world = mathutils.Matrix.Identity(4)
+
+        for target_collection, target_roots in occurrences.items():
+            matrices = numpy.array(
+                [occurrence_transforms[root_obj][0] for root_obj in target_roots],
+                dtype=numpy.float64
+            )
+            instances = create_instanced_objects(
+                instance_collection.name, target_collection, matrices=matrices, color=color)
+            for root_obj, instance in zip(target_roots, instances):
+                _, parent, matrix_parent_inverse, matrix_basis, users_collection = \
+                    occurrence_transforms[root_obj]
+                if parent is not None:
+                    instance.parent = parent
+                    instance.matrix_parent_inverse = matrix_parent_inverse
+                    instance.matrix_basis = matrix_basis
+                for collection in users_collection[1:]:
+                    collection.objects.link(instance)
+            ret.extend(instances)
+
+        for root_obj in roots[1:]:
+            to_remove.extend(subtrees[root_obj])
+
+    if len(to_remove) > 0:
+        bpy.data.batch_remove(to_remove)
+
+    return ret
+
+
+def get_mesh_to_objects_map(obj: bpy.types.Object, result: typing.DefaultDict[str, bpy.types.Object]):
+    for child in obj.children:
+        get_mesh_to_objects_map(child, result)
+
+    if obj.type == 'MESH':
+        original_mesh_name = utils.remove_object_duplicate_suffix(obj.data.name)
+        result[original_mesh_name].append(obj)
+
+
+def get_material_to_slots_map(obj: bpy.types.Object, result: typing.DefaultDict[str, bpy.types.MaterialSlot]):
+    for child in obj.children:
+        get_material_to_slots_map(child, result)
+
+    if obj.type == 'MESH':
+        for material_slot in obj.material_slots:
+            if material_slot.material is not None:
+                original_material_name = utils.remove_object_duplicate_suffix(
+                    material_slot.material.name)
+                result[original_material_name].append(material_slot)
+
+
+def get_armatures_to_objects_map(obj: bpy.types.Object, result: typing.DefaultDict[str, bpy.types.Object]):
+    for child in obj.children:
+        get_armatures_to_objects_map(child, result)
+
+    if obj.type == 'ARMATURE':
+        original_armature_name = utils.remove_object_duplicate_suffix(obj.data.name)
+        result[original_armature_name].append(obj)
+
+
+GetNameToUsersMapCallable = typing.Callable[[
+    bpy.types.Object, typing.DefaultDict[str, bpy.types.ID]], None]
+
+
+def make_data_blocks_unique_per_object(obj: bpy.types.Object, get_data_to_struct_map: GetNameToUsersMapCallable, data_block_name: str):
+    data_blocks_to_owner_structs = collections.defaultdict(list)
+    get_data_to_struct_map(obj, data_blocks_to_owner_structs)
+
+    for owner_structs in data_blocks_to_owner_structs.values():
+        if len(owner_structs) == 0:
+            continue
+
+        first_data_block = getattr(owner_structs[0], data_block_name)
+        if first_data_block.library is None and first_data_block.users == len(owner_structs):
+            continue
+
+        # data block is linked from library or it is used outside of object 'obj' -> create copy
+        data_block_duplicate = first_data_block.copy()
+        if getattr(first_data_block, "is_editmode", False):
+            # data block of an object in edit mode can't be swapped, we move the users outside
+            # of object 'obj' to the copy instead
+            owners = set(owner_structs)
+            for other_obj in bpy.data.objects:
+                if other_obj.data == first_data_block and other_obj not in owners:
+                    other_obj.data = data_block_duplicate
+            continue
+
+        for owner_struct in owner_structs:
+            setattr(owner_struct, data_block_name, data_block_duplicate)
+
+
+def make_data_blocks_local_shared(
+    obj: bpy.types.Object,
+    get_data_to_struct_map: GetNameToUsersMapCallable,
+    data_block_name: str,
+    local_copies: typing.Dict[bpy.types.ID, bpy.types.ID]
+) -> None:
+    """Replaces data blocks linked from library in hierarchy of 'obj' by local copies.
+
+    Only one local copy is created for each linked data block and it is shared by all objects
+    converted with the same 'local_copies' map. Compared to make_data_blocks_unique_per_object
+    this doesn't multiply memory by the number of converted instances.
+    """
+    data_blocks_to_owner_structs = collections.defaultdict(list)
+    get_data_to_struct_map(obj, data_blocks_to_owner_structs)
+
+    for owner_structs in data_blocks_to_owner_structs.values():
+        for owner_struct in owner_structs:
+            data_block = getattr(owner_struct, data_block_name)
+            if data_block.library is None:
+                continue
+
+            local_copy = local_copies.get(data_block, None)
+            if local_copy is None:
+                local_copy = data_block.copy()
+                local_copies[data_block] = local_copy
+            setattr(owner_struct, data_block_name, local_copy)
+
+
+COPY_ON_WRITE_PROPERTY = "polygoniq_copy_on_write"
+
+
+class CopyOnWriteDataKind(enum.IntFlag):
+    """Kinds of data blocks that are made single-user lazily after converting to editable"""
+    MESH = 1
+    MATERIAL = 2
+    ARMATURE = 4
+    ALL = MESH | MATERIAL | ARMATURE
+
+
+def mark_copy_on_write(
+    obj: bpy.types.Object,
+    local_copies: typing.Dict[bpy.types.ID, bpy.types.ID]
+) -> None:
+    """Marks hierarchy of 'obj' to have its data blocks made single-user when first edited.
+
+    Meshes and armatures linked from library are replaced by local copies shared across all
+    objects converted with the same 'local_copies' map, so the hierarchy can enter edit mode.
+    Materials stay shared until resolve_copy_on_write is called with CopyOnWriteDataKind.MATERIAL.
+    """
+    make_data_blocks_local_shared(obj, get_mesh_to_objects_map, "data", local_copies)
+    make_data_blocks_local_shared(obj, get_armatures_to_objects_map, "data", local_copies)
+    obj[COPY_ON_WRITE_PROPERTY] = int(CopyOnWriteDataKind.ALL)
+
+
+def find_copy_on_write_root(obj: bpy.types.Object) -> typing.Optional[bpy.types.Object]:
+    """Returns 'obj' or its closest ancestor that still has pending copy-on-write data blocks"""
+    current = obj
+    while current is not None:
+        if current.get(COPY_ON_WRITE_PROPERTY, 0) != 0:
+            return current
+        current = current.parent
+    return None
+
+
+def resolve_copy_on_write(
+    root_obj: bpy.types.Object,
+    kinds: CopyOnWriteDataKind = CopyOnWriteDataKind.ALL
+) -> None:
+    """Makes data blocks of given 'kinds' single-user for the hierarchy of 'root_obj'.
+
+    Data blocks shared only inside of the hierarchy stay shared, same as when converting
+    to editable without copy-on-write.
+    """
+    pending = CopyOnWriteDataKind(root_obj.get(COPY_ON_WRITE_PROPERTY, 0))
+    to_resolve = pending & kinds
+    if CopyOnWriteDataKind.MESH in to_resolve:
+        make_data_blocks_unique_per_object(root_obj, get_mesh_to_objects_map, "data")
+    if CopyOnWriteDataKind.MATERIAL in to_resolve:
+        make_data_blocks_unique_per_object(root_obj, get_material_to_slots_map, "material")
+    if CopyOnWriteDataKind.ARMATURE in to_resolve:
+        make_data_blocks_unique_per_object(root_obj, get_armatures_to_objects_map, "data")
+
+    remaining = pending & ~kinds
+    if remaining:
+        root_obj[COPY_ON_WRITE_PROPERTY] = int(remaining)
+    elif COPY_ON_WRITE_PROPERTY in root_obj:
+        del root_obj[COPY_ON_WRITE_PROPERTY]
+
+
+def resolve_copy_on_write_objects(
+    objects: typing.Iterable[bpy.types.Object],
+    kinds: CopyOnWriteDataKind = CopyOnWriteDataKind.ALL
+) -> None:
+    """Resolves pending copy-on-write of hierarchies 'objects' belong to. Call this before
+    editing materials of converted assets or from an explicit 'make single user' operator.
+    """
+    roots = set()
+    for obj in objects:
+        root_obj = find_copy_on_write_root(obj)
+        if root_obj is not None:
+            roots.add(root_obj)
+
+    for root_obj in roots:
+        resolve_copy_on_write(root_obj, kinds)
+
+
+# Object.mode -> kinds of data blocks edited in the mode, None if it depends on object type
+COPY_ON_WRITE_MODE_KINDS: typing.Dict[str, typing.Optional[CopyOnWriteDataKind]] = {
+    'EDIT': None,
+    'SCULPT': CopyOnWriteDataKind.MESH,
+    'VERTEX_PAINT': CopyOnWriteDataKind.MESH,
+    'WEIGHT_PAINT': CopyOnWriteDataKind.MESH,
+    # painted images are reached through materials, new paint slots are added to materials
+    'TEXTURE_PAINT': CopyOnWriteDataKind.MATERIAL,
+}
+
+
+def get_copy_on_write_mode_kinds(obj: bpy.types.Object) -> CopyOnWriteDataKind:
+    """Returns kinds of data blocks of 'obj' that its current mode edits"""
+    kinds = COPY_ON_WRITE_MODE_KINDS.get(obj.mode, CopyOnWriteDataKind(0))
+    if kinds is not None:
+        return kinds
+    if obj.type == 'MESH':
+        return CopyOnWriteDataKind.MESH
+    if obj.type == 'ARMATURE':
+        return CopyOnWriteDataKind.ARMATURE
+    return CopyOnWriteDataKind(0)
+
+
+def get_pending_copy_on_write_in_mode(
+    context: bpy.types.Context
+) -> typing.Dict[bpy.types.Object, CopyOnWriteDataKind]:
+    """Returns copy-on-write roots of objects in the current mode with kinds the mode edits"""
+    ret = {}
+    objects_in_mode = getattr(context, "objects_in_mode", None) or [context.active_object]
+    for obj in objects_in_mode:
+        if obj is None:
+            continue
+        kinds = get_copy_on_write_mode_kinds(obj)
+        if not kinds:
+            continue
+        root_obj = find_copy_on_write_root(obj)
+        if root_obj is None:
+            continue
+        kinds &= CopyOnWriteDataKind(root_obj[COPY_ON_WRITE_PROPERTY])
+        if kinds:
+            ret[root_obj] = ret.get(root_obj, CopyOnWriteDataKind(0)) | kinds
+
+    return ret
+
+
+def _object_mode_set(obj: bpy.types.Object, mode: str) -> None:
+    if hasattr(bpy.context, "temp_override"):
+        # Blender 3.2+
+        with bpy.context.temp_override(object=obj, active_object=obj):
+            bpy.ops.object.mode_set(mode=mode)
+    else:
+        bpy.ops.object.mode_set({"object": obj, "active_object": obj}, mode=mode)
+
+
+def resolve_copy_on_write_in_mode(context: bpy.types.Context) -> None:
+    """Makes data blocks edited in the current mode single-user for objects in the mode.
+
+    Object data can't be replaced while the object is in edit, sculpt or paint mode, objects are
+    switched to object mode while resolving and back to the mode afterwards.
+    """
+    pending = get_pending_copy_on_write_in_mode(context)
+    if len(pending) == 0:
+        return
+
+    active_obj = context.active_object
+    mode = active_obj.mode if active_obj is not None else 'OBJECT'
+    if mode != 'OBJECT':
+        _object_mode_set(active_obj, 'OBJECT')
+    try:
+        for root_obj, kinds in pending.items():
+            resolve_copy_on_write(root_obj, kinds)
+    finally:
+        if mode != 'OBJECT':
+            _object_mode_set(active_obj, mode)
+
+
+# whether resolving is already scheduled from depsgraph_update_post
+COPY_ON_WRITE_SCHEDULED = False
+
+
+def _resolve_scheduled_copy_on_write() -> None:
+    global COPY_ON_WRITE_SCHEDULED
+    COPY_ON_WRITE_SCHEDULED = False
+    resolve_copy_on_write_in_mode(bpy.context)
+    return None
+
+
+def copy_on_write_mode_changed() -> None:
+    """Resolves copy-on-write data right after the mode of an object changes, before the first
+    edit or stroke in the new mode. Message bus callbacks run outside of depsgraph evaluation,
+    data can be remapped there.
+    """
+    resolve_copy_on_write_in_mode(bpy.context)
+
+
+# owner of message bus subscriptions of this module, subscriptions are cleared by owner
+COPY_ON_WRITE_MSGBUS_OWNER = object()
+
+
+def subscribe_copy_on_write_mode_changes() -> None:
+    bpy.msgbus.clear_by_owner(COPY_ON_WRITE_MSGBUS_OWNER)
+    bpy.msgbus.subscribe_rna(
+        key=(bpy.types.Object, "mode"),
+        owner=COPY_ON_WRITE_MSGBUS_OWNER,
+        args=(),
+        notify=copy_on_write_mode_changed
+    )
+
+
+@bpy.app.handlers.persistent
+def copy_on_write_load_post(*args) -> None:
+    """Message bus subscriptions are cleared when a file is loaded"""
+    subscribe_copy_on_write_mode_changes()
+
+
+@bpy.app.handlers.persistent
+def copy_on_write_depsgraph_update_post(scene: bpy.types.Scene, depsgraph=None) -> None:
+    """Makes data of copy-on-write hierarchies single-user once they enter edit, sculpt or paint
+    mode, in case the mode change wasn't published to the message bus.
+
+    Resolving is deferred to a timer, data can't be safely remapped during depsgraph updates.
+    """
+    global COPY_ON_WRITE_SCHEDULED
+
+    if COPY_ON_WRITE_SCHEDULED or bpy.context.mode == 'OBJECT':
+        return
+    if len(get_pending_copy_on_write_in_mode(bpy.context)) == 0:
+        return
+
+    COPY_ON_WRITE_SCHEDULED = True
+    bpy.app.timers.register(_resolve_scheduled_copy_on_write, first_interval=0.0)
+
+
+# (emitter object, particle system name) -> origin object -> (N, 4, 4) array of world matrices
+ParticleInstanceMatrices = typing.Dict[
+    typing.Tuple[bpy.types.Object, str],
+    typing.Dict[bpy.types.Object, numpy.ndarray]
+]
+
+
+def get_particle_instance_matrices(
+    depsgraph: bpy.types.Depsgraph,
+    particle_system_prefix: str = PARTICLE_SYSTEM_PREFIX
+) -> ParticleInstanceMatrices:
+    """Reads world matrices of all instances of particle systems with 'particle_system_prefix'
+    in one pass over depsgraph.object_instances.
+
+    Only the top level instances are returned, e.g. for a particle system instancing collection
+    instance empties we return matrices of those empties, not of objects nested in them.
+    """
+    matrices = collections.defaultdict(lambda: collections.defaultdict(list))
+    # (emitter object, particle system name) -> origin objects that can be instanced
+    origins_cache = {}
+    for instance in depsgraph.object_instances:
+        if not instance.is_instance or instance.particle_system is None:
+            continue
+
+        particle_system = instance.particle_system
+        if not particle_system.name.startswith(particle_system_prefix):
+            continue
+
+        key = (instance.parent.original, particle_system.name)
+        origins = origins_cache.get(key, None)
+        if origins is None:
+            settings = particle_system.settings.original
+            if settings.render_type == 'COLLECTION' and settings.instance_collection is not None:
+                origins = set(settings.instance_collection.all_objects)
+            elif settings.render_type == 'OBJECT' and settings.instance_object is not None:
+                origins = {settings.instance_object}
+            else:
+                origins = set()
+            origins_cache[key] = origins
+
+        origin = instance.instance_object.original
+        if origin not in origins:
+            continue
+
+        # instance is only valid during the iteration, we have to copy the matrix
+        matrices[key][origin].append(instance.matrix_world.copy())
+
+    return {
+        key: {origin: numpy.array(origin_matrices, dtype=numpy.float32)
+              for origin, origin_matrices in origins.items()}
+        for key, origins in matrices.items()
+    }
+
+
+def instance_particle_system(
+    emitter: bpy.types.Object,
+    particle_system: bpy.types.ParticleSystem,
+    origin_matrices: typing.Dict[bpy.types.Object, numpy.ndarray]
+) -> typing.List[bpy.types.Object]:
+    """Creates lightweight objects in place of instances of 'particle_system'.
+
+    Alternative to duplicates_make_real, collection instance origins are replaced by collection
+    instance empties, other origins by object copies sharing the data. Created objects are
+    parented to 'emitter' and keep world transforms of the particle instances.
+    """
+    collections_ = emitter.users_collection
+    emitter_matrix_inverted = numpy.linalg.inv(numpy.array(emitter.matrix_world))
+    ret = []
+    for origin, matrices in origin_matrices.items():
+        if origin.instance_type == 'COLLECTION' and origin.instance_collection is not None:
+            # created objects have identity matrix_parent_inverse, their local transforms
+            # are relative to the emitter
+            instance_objs = create_instanced_objects(
+                origin.instance_collection.name,
+                collections_[0],
+                matrices=emitter_matrix_inverted @ matrices
+            )
+            for instance_obj in instance_objs:
+                for collection in collections_[1:]:
+                    collection.objects.link(instance_obj)
+                instance_obj.parent = emitter
+            ret.extend(instance_objs)
+            continue
+
+        for matrix in matrices:
+            instance_obj = origin.copy()
+            instance_obj.parent = None
+            for collection in collections_:
+                collection.objects.link(instance_obj)
+            instance_obj.parent = emitter
+            instance_obj.matrix_world = mathutils.Matrix(matrix)
+            ret.append(instance_obj)
+
+    return ret
+
+
+def make_selection_editable(context: bpy.types.Context, delete_base_empty: bool, keep_selection: bool = True, keep_active: bool = True, copy_on_write: bool = False, particle_systems_as_instances: bool = False) -> typing.List[str]:
+    """Converts selected linked assets to editable objects.
+
+    If 'copy_on_write' is True, converted objects keep sharing their meshes, materials and
+    armatures. These are made single-user only when first edited, see mark_copy_on_write.
+
+    If 'particle_systems_as_instances' is True, botaniq particle systems are converted to
+    collection instance empties instead of real objects, see instance_particle_system.
+    """
+    def apply_botaniq_particle_system_modifiers(
+        obj: bpy.types.Object,
+        particle_instance_matrices: typing.Optional[ParticleInstanceMatrices]
+    ):
         for child in obj.children:
-            apply_botaniq_particle_system_modifiers(child)
+            apply_botaniq_particle_system_modifiers(child, particle_instance_matrices)
 
         for modifier in obj.modifiers:
             if modifier.type != 'PARTICLE_SYSTEM' or not modifier.name.startswith(PARTICLE_SYSTEM_PREFIX):
                 continue
 
-            clear_selection(context)
-            obj.select_set(True)
-            bpy.ops.object.duplicates_make_real(use_base_parent=True, use_hierarchy=True)
-            obj.select_set(False)
+            if particle_instance_matrices is not None:
+                instance_particle_system(
+                    obj,
+                    modifier.particle_system,
+                    particle_instance_matrices.get((obj, modifier.particle_system.name), {})
+                )
+            else:
+                clear_selection(context)
+                obj.select_set(True)
+                bpy.ops.object.duplicates_make_real(use_base_parent=True, use_hierarchy=True)
+                obj.select_set(False)
 
             # Remove collection with unused origin objects previously used for particle system
             if modifier.name in bpy.data.collections:
@@ -783,55 +1525,9 @@ def make_selection_editable(context: bpy.types.Context, delete_base_empty: bool,
                 obj["copyright"] = copyright
                 obj["polygoniq_addon"] = polygoniq_addon
                 obj["polygoniq_addon_blend_path"] = polygoniq_blend_path
+                scene_index.update_object_properties(obj)
                 return
 
-    def get_mesh_to_objects_map(obj: bpy.types.Object, result: typing.DefaultDict[str, bpy.types.Object]):
-        for child in obj.children:
-            get_mesh_to_objects_map(child, result)
-
-        if obj.type == 'MESH':
-            original_mesh_name = utils.remove_object_duplicate_suffix(obj.data.name)
-            result[original_mesh_name].append(obj)
-
-    def get_material_to_slots_map(obj: bpy.types.Object, result: typing.DefaultDict[str, bpy.types.MaterialSlot]):
-        for child in obj.children:
-            get_material_to_slots_map(child, result)
-
-        if obj.type == 'MESH':
-            for material_slot in obj.material_slots:
-                if material_slot.material is not None:
-                    original_material_name = utils.remove_object_duplicate_suffix(
-                        material_slot.material.name)
-                    result[original_material_name].append(material_slot)
-
-    def get_armatures_to_objects_map(obj: bpy.types.Object, result: typing.DefaultDict[str, bpy.types.Object]):
-        for child in obj.children:
-            get_armatures_to_objects_map(child, result)
-
-        if obj.type == 'ARMATURE':
-            original_armature_name = utils.remove_object_duplicate_suffix(obj.data.name)
-            result[original_armature_name].append(obj)
-
-    GetNameToUsersMapCallable = typing.Callable[[
-        bpy.types.Object, typing.DefaultDict[str, bpy.types.ID]], None]
-
-    def make_data_blocks_unique_per_object(obj: bpy.types.Object, get_data_to_struct_map: GetNameToUsersMapCallable, data_block_name: str):
-        data_blocks_to_owner_structs = collections.defaultdict(list)
-        get_data_to_struct_map(obj, data_blocks_to_owner_structs)
-
-        for owner_structs in data_blocks_to_owner_structs.values():
-            if len(owner_structs) == 0:
-                continue
-
-            first_data_block = getattr(owner_structs[0], data_block_name)
-            if first_data_block.library is None and first_data_block.users == len(owner_structs):
-                continue
-
-            # data block is linked from library or it is used outside of object 'obj' -> create copy
-            data_block_duplicate = first_data_block.copy()
-            for owner_struct in owner_structs:
-                setattr(owner_struct, data_block_name, data_block_duplicate)
-
     selected_objects_names = [obj.name for obj in context.selected_objects]
     prev_active_object_name = context.active_object.name if context.active_object else None
 
@@ -839,9 +1535,15 @@ def make_selection_editable(context: bpy.types.Context, delete_base_empty: bool,
     for obj in context.selected_objects:
         find_instanced_collection_objects(obj, instanced_collection_objects)
 
+    particle_instance_matrices = None
+    if particle_systems_as_instances:
+        particle_instance_matrices = get_particle_instance_matrices(
+            context.evaluated_depsgraph_get())
+
     for obj_name in selected_objects_names:
         if obj_name in bpy.data.objects:
-            apply_botaniq_particle_system_modifiers(bpy.data.objects[obj_name])
+            apply_botaniq_particle_system_modifiers(
+                bpy.data.objects[obj_name], particle_instance_matrices)
 
     # origin objects from particle systems were removed from scene
     selected_objects_names = [
@@ -906,18 +1608,23 @@ def make_selection_editable(context: bpy.types.Context, delete_base_empty: bool,
                 bpy.data.objects.remove(obj)
 
     selected_objects = []
+    # linked data block -> local copy shared by all objects converted with copy-on-write
+    local_copies = {}
     for obj_name in selected_objects_names:
         if obj_name not in bpy.data.objects:
             logger.error(f"Previously selected object: {obj_name} is no longer in bpy.data")
             continue
 
         obj = bpy.data.objects[obj_name]
-        # Create copy of meshes shared with other objects or linked from library
-        make_data_blocks_unique_per_object(obj, get_mesh_to_objects_map, "data")
-        # Create copy of materials shared with other objects or linked from library
-        make_data_blocks_unique_per_object(obj, get_material_to_slots_map, "material")
-        # Create copy of armature data shared with other objects or linked from library
-        make_data_blocks_unique_per_object(obj, get_armatures_to_objects_map, "data")
+        if copy_on_write:
+            mark_copy_on_write(obj, local_copies)
+        else:
+            # Create copy of meshes shared with other objects or linked from library
+            make_data_blocks_unique_per_object(obj, get_mesh_to_objects_map, "data")
+            # Create copy of materials shared with other objects or linked from library
+            make_data_blocks_unique_per_object(obj, get_material_to_slots_map, "material")
+            # Create copy of armature data shared with other objects or linked from library
+            make_data_blocks_unique_per_object(obj, get_armatures_to_objects_map, "data")
 
         # Blender operator duplicates_make_real doesn't append animation data with drivers.
         # Thus we have to create those drivers dynamically based on bone names.
@@ -947,39 +1654,138 @@ def make_selection_editable(context: bpy.types.Context, delete_base_empty: bool,
     return selected_objects
 
 
-def calculate_mesh_area(obj: bpy.types.Object, include_weight: bool = False):
-    mesh = obj.data
-    try:
-        if obj.mode == "EDIT":
-            bm = bmesh.from_edit_mesh(mesh)
-        else:
-            bm = bmesh.new()
-            bm.from_mesh(mesh)
+def get_vertex_group_weights(
+    mesh: bpy.types.Mesh,
+    group_index: int
+) -> typing.Tuple[numpy.ndarray, numpy.ndarray]:
+    """Returns dense per-vertex weights of vertex group with 'group_index' and a boolean mask
+    of vertices that are assigned to the group. Vertex groups are read in one pass.
+    """
+    weights = numpy.zeros(len(mesh.vertices), dtype=numpy.float64)
+    assigned = numpy.zeros(len(mesh.vertices), dtype=bool)
+    for vertex in mesh.vertices:
+        for group_element in vertex.groups:
+            if group_element.group == group_index:
+                weights[vertex.index] = group_element.weight
+                assigned[vertex.index] = True
+                break
+
+    return weights, assigned
+
+
+class MeshPolygonArrays:
+    """Vertex coordinates and polygon topology of a mesh read with foreach_get.
+
+    Corners of all polygons are flattened polygon by polygon, 'corner_polygons' maps each corner
+    to its polygon, 'corner_vertices' to its vertex and 'next_corner_vertices' to the vertex of
+    the next corner in the same polygon.
+    """
 
-        bm.transform(obj.matrix_world)
+    def __init__(self, mesh: bpy.types.Mesh):
+        self.co = numpy.empty(len(mesh.vertices) * 3, dtype=numpy.float32)
+        mesh.vertices.foreach_get("co", self.co)
+        self.co = self.co.reshape(-1, 3).astype(numpy.float64)
+
+        self.polygon_count = len(mesh.polygons)
+        loop_starts = numpy.empty(self.polygon_count, dtype=numpy.int32)
+        loop_totals = numpy.empty(self.polygon_count, dtype=numpy.int32)
+        mesh.polygons.foreach_get("loop_start", loop_starts)
+        mesh.polygons.foreach_get("loop_total", loop_totals)
+        loop_vertices = numpy.empty(len(mesh.loops), dtype=numpy.int32)
+        mesh.loops.foreach_get("vertex_index", loop_vertices)
+
+        self.corner_polygons = numpy.repeat(numpy.arange(self.polygon_count), loop_totals)
+        first_corners = numpy.cumsum(loop_totals) - loop_totals
+        corner_in_polygon = numpy.arange(len(self.corner_polygons)) - \
+            first_corners[self.corner_polygons]
+        polygon_starts = loop_starts[self.corner_polygons]
+        polygon_totals = loop_totals[self.corner_polygons]
+        self.corner_vertices = loop_vertices[polygon_starts + corner_in_polygon]
+        self.next_corner_vertices = \
+            loop_vertices[polygon_starts + (corner_in_polygon + 1) % polygon_totals]
+        self.first_vertices = loop_vertices[loop_starts]
+
+    def calculate_polygon_areas(self, matrix: mathutils.Matrix) -> numpy.ndarray:
+        """Returns areas of all polygons transformed by 'matrix'. Same as BMFace.calc_area,
+        non-planar polygons are measured by the magnitude of their Newell normal.
+        """
+        matrix = numpy.array(matrix, dtype=numpy.float64)
+        co = self.co @ matrix[:3, :3].T + matrix[:3, 3]
+        # polygons are measured relative to their first vertex to keep precision far from origin
+        origins = co[self.first_vertices][self.corner_polygons]
+        crosses = numpy.cross(
+            co[self.corner_vertices] - origins,
+            co[self.next_corner_vertices] - origins
+        )
+        normals = numpy.stack([
+            numpy.bincount(self.corner_polygons, crosses[:, i], minlength=self.polygon_count)
+            for i in range(3)
+        ], axis=1)
+        return 0.5 * numpy.linalg.norm(normals, axis=1)
+
+    def calculate_polygon_weights(
+        self,
+        weights: numpy.ndarray,
+        assigned: numpy.ndarray
+    ) -> numpy.ndarray:
+        """Returns average weight of assigned vertices of each polygon, polygons without any
+        assigned vertex have weight 0.
+        """
+        corner_assigned = assigned[self.corner_vertices]
+        weight_sums = numpy.bincount(
+            self.corner_polygons,
+            numpy.where(corner_assigned, weights[self.corner_vertices], 0.0),
+            minlength=self.polygon_count
+        )
+        assigned_counts = numpy.bincount(
+            self.corner_polygons, corner_assigned, minlength=self.polygon_count)
+        return numpy.divide(
+            weight_sums,
+            assigned_counts,
+            out=numpy.zeros(self.polygon_count, dtype=numpy.float64),
+            where=assigned_counts > 0
+        )
+
+
+def calculate_meshes_area(
+    objects: typing.Iterable[bpy.types.Object],
+    include_weight: bool = False
+) -> typing.List[float]:
+    """Returns world space surface area of each of mesh 'objects'.
+
+    If 'include_weight' is True, area of each polygon is multiplied by average weight of its
+    vertices in the active vertex group, vertices outside of the group are not counted.
+    Mesh arrays are read only once for objects sharing the same mesh.
+    """
+    mesh_arrays = {}
+    ret = []
+    for obj in objects:
+        if obj.mode == 'EDIT':
+            obj.update_from_editmode()
+
+        mesh = obj.data
+        arrays = mesh_arrays.get(mesh, None)
+        if arrays is None:
+            arrays = MeshPolygonArrays(mesh)
+            mesh_arrays[mesh] = arrays
+
+        polygon_areas = arrays.calculate_polygon_areas(obj.matrix_world)
         if include_weight:
-            vg = obj.vertex_groups.active
-            mesh_area = 0
-            for face in bm.faces:
-                f_area = face.calc_area()
-                weighted_verts = 0
-                weight = 0
-                for v in face.verts:
-                    # heavy approach, but we don't know whether i vertex is in the group :(
-                    try:
-                        weight += vg.weight(v.index)
-                        weighted_verts += 1
-                    except:
-                        pass
-                if weighted_verts > 0:
-                    mesh_area += (weight / weighted_verts) * f_area
-        else:
-            mesh_area = sum(f.calc_area() for f in bm.faces)
+            vertex_group = obj.vertex_groups.active
+            if vertex_group is None:
+                ret.append(0.0)
+                continue
 
-    finally:
-        bm.free()
+            weights, assigned = get_vertex_group_weights(mesh, vertex_group.index)
+            polygon_areas *= arrays.calculate_polygon_weights(weights, assigned)
+
+        ret.append(float(polygon_areas.sum()))
 
-    return mesh_area
+    return ret
+
+
+def calculate_mesh_area(obj: bpy.types.Object, include_weight: bool = False):
+    return calculate_meshes_area([obj], include_weight)[0]
 
 
 HierarchyNameComparator = typing.Callable[[str, typing.Optional[str]], bool]
@@ -989,20 +1795,12 @@ def find_object_in_hierarchy(
     root_obj: bpy.types.Object,
     name_comparator: HierarchyNameComparator,
 ) -> typing.Optional[bpy.types.Object]:
-    # We don't use get_hierarchy function, because here we can return the desired
-    # object before going through the whole hierarchy
-    def search_hierarchy(parent_obj: bpy.types.Object) -> typing.Optional[bpy.types.Object]:
-        if name_comparator(parent_obj.name, root_obj.name):
-            return parent_obj
+    # subtree is in depth first order, same order the recursive search visited objects in
+    for obj in scene_index.HierarchyIndex().get_subtree(root_obj):
+        if name_comparator(obj.name, root_obj.name):
+            return obj
 
-        for obj in parent_obj.children:
-            candidate = search_hierarchy(obj)
-            if candidate is not None:
-                return candidate
-
-        return None
-
-    return search_hierarchy(root_obj)
+    return None
 
 
 def get_hierarchy(root):
@@ -1010,6 +1808,10 @@ def get_hierarchy(root):
     """
 
     assert hasattr(root, "children")
+    if isinstance(root, bpy.types.Object):
+        # obj.children scans all objects, one snapshot is built for the whole hierarchy instead
+        return scene_index.HierarchyIndex().get_subtree(root)
+
     ret = [root]
     for child in root.children:
         ret.extend(get_hierarchy(child))
@@ -1018,10 +1820,9 @@ def get_hierarchy(root):
 
 
 def collection_get(context, name, parent=None):
-    scene_collections = get_hierarchy(context.scene.collection)
-    for coll in scene_collections:
-        if utils.remove_object_duplicate_suffix(coll.name) == name:
-            return coll
+    coll = scene_index.collection_index.get_collection(context.scene.collection, name)
+    if coll is not None:
+        return coll
 
     coll = bpy.data.collections.new(name)
     if parent is None:
@@ -1029,6 +1830,7 @@ def collection_get(context, name, parent=None):
     else:
         parent.children.link(coll)
 
+    scene_index.collection_index.add_collection(context.scene.collection, coll, parent)
     return coll
 
 
@@ -1046,18 +1848,44 @@ def copy_object_hierarchy(root_obj: bpy.types.Object) -> bpy.types.Object:
     """
     Copies 'root_obj' and its hierarchy while preserving parenting, returns the root copy
     """
+    return copy_object_hierarchies(root_obj, 1)[0]
 
-    def copy_hierarchy(obj: bpy.types.Object, parent: bpy.types.Object):
-        obj_copy = obj.copy()
-        obj_copy.parent = parent
-        for child in obj.children:
-            copy_hierarchy(child, obj_copy)
-
-    root_obj_copy = root_obj.copy()
-    for obj in root_obj.children:
-        copy_hierarchy(obj, root_obj_copy)
 
-    return root_obj_copy
+def copy_object_hierarchies(
+    root_obj: bpy.types.Object,
+    count: int,
+    collection: typing.Optional[bpy.types.Collection] = None
+) -> typing.List[bpy.types.Object]:
+    """Copies 'root_obj' and its hierarchy 'count' times while preserving parenting, returns
+    the root copies.
+
+    Copies share object data and materials with the originals. The hierarchy is traversed once,
+    parents of copies are set by indices into it. If 'collection' is given, each copy is linked
+    to it right away, otherwise copies aren't linked to any collection.
+    """
+    # the snapshot is read before any copy is created
+    hierarchy_index = scene_index.HierarchyIndex()
+    # depth first order, parent always precedes its children
+    hierarchy = hierarchy_index.get_subtree(root_obj)
+    obj_indices = {obj: i for i, obj in enumerate(hierarchy)}
+    parent_indices = [obj_indices.get(hierarchy_index.get_parent(obj), -1) for obj in hierarchy]
+    # the root keeps its parent, same as obj.copy() does
+    parent_indices[0] = -1
+
+    root_copies = []
+    for _ in range(count):
+        copies = []
+        for obj, parent_index in zip(hierarchy, parent_indices):
+            obj_copy = obj.copy()
+            if parent_index >= 0:
+                obj_copy.parent = copies[parent_index]
+            if collection is not None:
+                collection.objects.link(obj_copy)
+            copies.append(obj_copy)
+
+        root_copies.append(copies[0])
+
+    return root_copies
 
 
 def collection_link_hierarchy(collection: bpy.types.Collection, root_obj: bpy.types.Object):
@@ -1085,15 +1913,7 @@ def find_layer_collection(
     which contains 'target' collection.
     """
 
-    if view_layer_root.collection == target:
-        return view_layer_root
-
-    for layer_child in view_layer_root.children:
-        found_layer_collection = find_layer_collection(layer_child, target)
-        if found_layer_collection is not None:
-            return found_layer_collection
-
-    return None
+    return scene_index.collection_index.get_layer_collection(view_layer_root, target)
 
 
 def clear_selection(context: bpy.types.Context):
@@ -1109,18 +1929,91 @@ def get_top_level_material_nodes_with_name(obj: bpy.types.Object, node_name: str
     to access materials that are local inside blend of linked object. This could be confusing
     behavior of this function, so this function doesn't search for any nodes in linked objects.
     """
-    assert obj.instance_collection != 'COLLECTION'
+    assert obj.instance_type != 'COLLECTION'
 
     for material_slot in obj.material_slots:
         if material_slot.material is None:
             continue
-        for node in material_slot.material.node_tree.nodes:
-            if node.type == 'GROUP':
-                if node.node_tree.name == node_name:
-                    yield node
-            else:
-                if node.name == node_name:
-                    yield node
+        yield from scene_index.material_node_index.get_nodes(material_slot.material, node_name)
+
+
+def get_top_level_materials_nodes_with_name(
+    objs: typing.Iterable[bpy.types.Object],
+    node_name: str
+) -> typing.List[bpy.types.Node]:
+    """Returns top level nodes or node groups named 'node_name' in materials of 'objs'.
+
+    Each material is searched only once no matter how many objects share it, so bulk updates
+    of material parameters scale with the count of unique materials. Same restrictions as in
+    'get_top_level_material_nodes_with_name' apply.
+    """
+    materials = {}
+    for obj in objs:
+        assert obj.instance_type != 'COLLECTION'
+        for material_slot in obj.material_slots:
+            if material_slot.material is not None:
+                materials.setdefault(material_slot.material, None)
+
+    ret = []
+    for material in materials:
+        ret.extend(scene_index.material_node_index.get_nodes(material, node_name))
+    return ret
+
+
+# modifier type -> identifiers of writable properties in bl_rna order
+MODIFIER_WRITABLE_PROPERTIES: typing.Dict[str, typing.Tuple[str, ...]] = {}
+# modifier type -> values of writable properties of a newly created modifier
+MODIFIER_DEFAULT_VALUES: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+# modifier container name -> (container pointer, [(name, type, [(property, value)])])
+MODIFIER_CONTAINER_STACKS: typing.Dict[str, typing.Tuple[
+    int, typing.List[typing.Tuple[str, str, typing.List[typing.Tuple[str, typing.Any]]]]]] = {}
+
+
+def _get_comparable_property_value(value: typing.Any) -> typing.Any:
+    # bpy_prop_array doesn't compare equal to anything but itself
+    if isinstance(value, bpy.types.bpy_prop_array):
+        return tuple(value)
+    return value
+
+
+def get_modifier_writable_properties(modifier: bpy.types.Modifier) -> typing.Tuple[str, ...]:
+    properties = MODIFIER_WRITABLE_PROPERTIES.get(modifier.type, None)
+    if properties is None:
+        properties = tuple(p.identifier for p in modifier.bl_rna.properties if not p.is_readonly)
+        MODIFIER_WRITABLE_PROPERTIES[modifier.type] = properties
+    return properties
+
+
+def get_modifier_container_stack(
+    modifier_container: bpy.types.Object
+) -> typing.List[typing.Tuple[str, str, typing.List[typing.Tuple[str, typing.Any]]]]:
+    """Returns [(name, type, [(property, value)])] of modifiers of 'modifier_container'.
+
+    Only values differing from defaults of a new modifier are listed, in bl_rna order. Defaults
+    are known only after first modifier of given type is created, until then all values are listed.
+    The container is expected to be an appended asset that isn't edited, the result is cached
+    until the container object is replaced, undo or load of another file.
+    """
+    cached = MODIFIER_CONTAINER_STACKS.get(modifier_container.name, None)
+    if cached is not None and cached[0] == modifier_container.as_pointer():
+        return cached[1]
+
+    stack = []
+    complete = True
+    for modifier in modifier_container.modifiers:
+        defaults = MODIFIER_DEFAULT_VALUES.get(modifier.type, None)
+        complete = complete and defaults is not None
+        values = []
+        for prop in get_modifier_writable_properties(modifier):
+            value = getattr(modifier, prop)
+            if defaults is None or defaults[prop] != _get_comparable_property_value(value):
+                values.append((prop, value))
+        stack.append((modifier.name, modifier.type, values))
+
+    if complete:
+        MODIFIER_CONTAINER_STACKS[modifier_container.name] = \
+            (modifier_container.as_pointer(), stack)
+    return stack
 
 
 def append_modifiers_from_library(
@@ -1131,6 +2024,8 @@ def append_modifiers_from_library(
     """Add all modifiers from object with given name in given .blend library to 'target_objects'.
 
     It doesn't copy complex and readonly properties, e.g. properties that are driven by FCurve.
+    The modifier stack of the container is read once and cached, only properties differing from
+    defaults of a new modifier are set on the targets.
     """
     if modifier_container_name not in bpy.data.objects:
         with bpy.data.libraries.load(library_path) as (data_from, data_to):
@@ -1140,17 +2035,28 @@ def append_modifiers_from_library(
     assert modifier_container_name in bpy.data.objects
     modifier_container = bpy.data.objects[modifier_container_name]
 
+    stack = get_modifier_container_stack(modifier_container)
     for obj in target_objs:
-        for src_modifier in modifier_container.modifiers:
-            assert src_modifier.name not in obj.modifiers
-            dest_modifier = obj.modifiers.new(src_modifier.name, src_modifier.type)
+        for name, type_, values in stack:
+            assert name not in obj.modifiers
+            dest_modifier = obj.modifiers.new(name, type_)
+            if type_ not in MODIFIER_DEFAULT_VALUES:
+                MODIFIER_DEFAULT_VALUES[type_] = {
+                    prop: _get_comparable_property_value(getattr(dest_modifier, prop))
+                    for prop in get_modifier_writable_properties(dest_modifier)
+                }
 
-            # collect names of writable properties
-            properties = [p.identifier for p in src_modifier.bl_rna.properties if not p.is_readonly]
+            for prop, value in values:
+                setattr(dest_modifier, prop, value)
 
-            # copy those properties
-            for prop in properties:
-                setattr(dest_modifier, prop, getattr(src_modifier, prop))
+        # the first object could have revealed defaults of new modifier types
+        stack = get_modifier_container_stack(modifier_container)
+
+
+@bpy.app.handlers.persistent
+def modifier_container_stacks_invalidate(*args) -> None:
+    """Cached values can reference data-blocks that were reloaded or belong to previous file"""
+    MODIFIER_CONTAINER_STACKS.clear()
 
 
 def can_have_materials_assigned(obj: bpy.types.Object) -> bool:
@@ -1163,3 +2069,26 @@ def can_have_materials_assigned(obj: bpy.types.Object) -> bool:
 
     return obj.type in {'MESH', 'CURVE', 'SURFACE', 'META', 'FONT', 'GPENCIL', 'VOLUME'} \
         and hasattr(obj, "material_slots")
+
+
+def register():
+    # every addon vendoring polib registers its own copy, copy-on-write resolving is idempotent
+    # so the copies don't interfere
+    utils.register_handler(
+        bpy.app.handlers.depsgraph_update_post, copy_on_write_depsgraph_update_post)
+    utils.register_handler(bpy.app.handlers.load_post, copy_on_write_load_post)
+    subscribe_copy_on_write_mode_changes()
+    utils.register_handler(bpy.app.handlers.undo_post, modifier_container_stacks_invalidate)
+    utils.register_handler(bpy.app.handlers.redo_post, modifier_container_stacks_invalidate)
+    utils.register_handler(bpy.app.handlers.load_post, modifier_container_stacks_invalidate)
+
+
+def unregister():
+    utils.unregister_handler(bpy.app.handlers.load_post, modifier_container_stacks_invalidate)
+    utils.unregister_handler(bpy.app.handlers.redo_post, modifier_container_stacks_invalidate)
+    utils.unregister_handler(bpy.app.handlers.undo_post, modifier_container_stacks_invalidate)
+    bpy.msgbus.clear_by_owner(COPY_ON_WRITE_MSGBUS_OWNER)
+    utils.unregister_handler(bpy.app.handlers.load_post, copy_on_write_load_post)
+    utils.unregister_handler(
+        bpy.app.handlers.depsgraph_update_post, copy_on_write_depsgraph_update_post)
+    MODIFIER_CONTAINER_STACKS.clear()
@@ -0,0 +1,465 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+import bpy
+import hashlib
+import numpy
+import time
+import typing
+import logging
+
+if "utils" not in locals():
+    from . import utils
+else:
+    import importlib
+    utils = importlib.reload(utils)
+
+
+logger = logging.getLogger(__name__)
+
+
+# data block -> hex digest, shared by nested hashing during one call
+HashMemo = typing.Dict[bpy.types.ID, str]
+
+# properties that don't change how a node tree evaluates
+IGNORED_NODE_PROPERTIES = {
+    "name", "label", "location", "width", "width_hidden", "height", "dimensions", "select",
+    "hide", "color", "use_custom_color", "show_options", "show_preview", "show_texture",
+    "parent", "internal_links", "inputs", "outputs", "rna_type", "type", "bl_idname",
+    "bl_label", "bl_description", "bl_icon", "bl_static_type", "bl_width_default",
+    "bl_width_min", "bl_width_max", "bl_height_default", "bl_height_min", "bl_height_max"
+}
+# properties of all data blocks, e.g. name or users, these are never hashed
+IGNORED_ID_PROPERTIES = {
+    "rna_type", "name", "name_full", "original", "users", "use_fake_user", "use_extra_user",
+    "is_embedded_data", "is_evaluated", "is_missing", "is_runtime_data", "is_library_indirect",
+    "tag", "is_editmode", "library", "library_weak_reference", "asset_data", "override_library",
+    "preview", "session_uid", "id_type", "is_linked_packed", "node_tree", "animation_data",
+    "paint_active_slot", "texture_paint_images", "texture_paint_slots"
+}
+# properties of modifiers that only affect UI
+IGNORED_MODIFIER_PROPERTIES = {
+    "rna_type", "name", "show_expanded", "is_active", "is_override_data", "persistent_uid",
+    "use_pin_to_last", "execution_time"
+}
+# how deep nested structs, e.g. ColorRamp elements or CurveMapping points, are followed
+MAX_STRUCT_DEPTH = 4
+
+
+def _get_value_signature(value: typing.Any, memo: HashMemo, depth: int) -> typing.Any:
+    """Converts property value to a hashable representation independent of data block names
+    where possible.
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, bpy.types.NodeTree):
+        return ("NodeTree", get_node_tree_hash(value, memo))
+    if isinstance(value, bpy.types.ID):
+        # other data blocks, e.g. images or objects are compared by identity
+        return (type(value).__name__, value.name_full)
+    if isinstance(value, bpy.types.bpy_struct):
+        return _get_struct_signature(value, memo, depth + 1, ())
+    if isinstance(value, (set, frozenset)):
+        # enum flags
+        return tuple(sorted(value))
+    if isinstance(value, bpy.types.bpy_prop_collection):
+        return tuple(_get_value_signature(item, memo, depth) for item in value)
+    try:
+        # bpy_prop_array, mathutils types
+        return tuple(_get_value_signature(item, memo, depth) for item in value)
+    except TypeError:
+        return repr(value)
+
+
+def _get_struct_signature(
+    struct: bpy.types.bpy_struct,
+    memo: HashMemo,
+    depth: int,
+    ignored: typing.Collection[str]
+) -> typing.Any:
+    if depth > MAX_STRUCT_DEPTH:
+        return None
+
+    ret = [struct.bl_rna.identifier]
+    for prop in struct.bl_rna.properties:
+        if prop.identifier in ignored or prop.identifier == "rna_type":
+            continue
+        # readonly pointers and collections carry nested data, e.g. ColorRamp of ValToRGB node
+        if prop.is_readonly and prop.type not in {'POINTER', 'COLLECTION'}:
+            continue
+        try:
+            value = getattr(struct, prop.identifier)
+        except AttributeError:
+            continue
+        ret.append((prop.identifier, _get_value_signature(value, memo, depth)))
+
+    return tuple(ret)
+
+
+def _get_socket_signature(socket: bpy.types.NodeSocket, memo: HashMemo) -> typing.Any:
+    if not hasattr(socket, "default_value"):
+        return (socket.identifier, )
+    return (socket.identifier, _get_value_signature(socket.default_value, memo, 0))
+
+
+def hash_signature(value: typing.Any) -> str:
+    """Returns short hex digest of repr of a hashable signature"""
+    return hashlib.blake2b(repr(value).encode(), digest_size=16).hexdigest()
+
+
+def get_custom_properties_hash(struct: bpy.types.bpy_struct) -> str:
+    """Returns hash of custom properties of 'struct', e.g. of an object or a pose bone"""
+    signature = []
+    for key in sorted(struct.keys()):
+        if key == "_RNA_UI":
+            # UI data of custom properties in Blender versions before 3.0
+            continue
+        value = struct[key]
+        if hasattr(value, "to_dict"):
+            value = value.to_dict()
+        elif hasattr(value, "to_list"):
+            value = value.to_list()
+        signature.append((key, value))
+
+    return hash_signature(tuple(signature))
+
+
+def get_node_tree_hash(node_tree: bpy.types.NodeTree, memo: typing.Optional[HashMemo] = None) -> str:
+    """Returns hash of the structure of 'node_tree' that doesn't depend on names of nodes or
+    of the tree itself.
+
+    Hashed are node types, node properties, default values of unlinked inputs and of outputs,
+    links and hashes of nested node groups. Node names are replaced by labels refined by their
+    neighbourhood (Weisfeiler-Lehman) until the labels stop splitting, so identical trees built
+    in different order get the same hash. Hashes are stored in 'memo' and reused for nested
+    node groups.
+    """
+    if memo is None:
+        memo = {}
+    cached = memo.get(node_tree, None)
+    if cached is not None:
+        return cached
+
+    nodes = [node for node in node_tree.nodes if node.type != 'FRAME']
+    node_indices = {node: i for i, node in enumerate(nodes)}
+    links = []
+    for link in node_tree.links:
+        if link.from_node not in node_indices or link.to_node not in node_indices:
+            continue
+        links.append((
+            node_indices[link.from_node],
+            link.from_socket.identifier,
+            node_indices[link.to_node],
+            link.to_socket.identifier,
+            getattr(link, "is_muted", False)
+        ))
+
+    linked_inputs = {(to_node, to_socket) for _, _, to_node, to_socket, _ in links}
+    labels = []
+    for i, node in enumerate(nodes):
+        inputs = tuple(
+            _get_socket_signature(socket, memo)
+            for socket in node.inputs
+            if (i, socket.identifier) not in linked_inputs
+        )
+        outputs = tuple(_get_socket_signature(socket, memo) for socket in node.outputs)
+        properties = _get_struct_signature(node, memo, 0, IGNORED_NODE_PROPERTIES)
+        labels.append(hash_signature((node.bl_idname, properties, inputs, outputs)))
+
+    # refine labels by labels of linked nodes until the partition of nodes stops changing
+    distinct_labels = len(set(labels))
+    for _ in range(len(nodes)):
+        neighbourhoods = [[] for _ in nodes]
+        for from_node, from_socket, to_node, to_socket, is_muted in links:
+            neighbourhoods[from_node].append(
+                ("out", from_socket, labels[to_node], to_socket, is_muted))
+            neighbourhoods[to_node].append(
+                ("in", to_socket, labels[from_node], from_socket, is_muted))
+        labels = [
+            hash_signature((label, sorted(neighbourhood)))
+            for label, neighbourhood in zip(labels, neighbourhoods)
+        ]
+        new_distinct_labels = len(set(labels))
+        if new_distinct_labels == distinct_labels:
+            break
+        distinct_labels = new_distinct_labels
+
+    interface = getattr(node_tree, "interface", None)
+    if interface is not None:
+        # Blender 4.0+
+        interface_signature = _get_value_signature(interface.items_tree, memo, 0)
+    else:
+        interface_signature = (
+            _get_value_signature(node_tree.inputs, memo, 0),
+            _get_value_signature(node_tree.outputs, memo, 0)
+        )
+
+    ret = hash_signature((
+        node_tree.bl_idname,
+        interface_signature,
+        sorted(labels),
+        sorted((labels[from_node], from_socket, labels[to_node], to_socket, is_muted)
+               for from_node, from_socket, to_node, to_socket, is_muted in links)
+    ))
+    memo[node_tree] = ret
+    return ret
+
+
+def get_material_hash(material: bpy.types.Material, memo: typing.Optional[HashMemo] = None) -> str:
+    """Returns hash of settings and node tree of 'material' that doesn't depend on its name"""
+    if memo is None:
+        memo = {}
+    cached = memo.get(material, None)
+    if cached is not None:
+        return cached
+
+    node_tree_hash = None
+    if material.use_nodes and material.node_tree is not None:
+        node_tree_hash = get_node_tree_hash(material.node_tree, memo)
+
+    ret = hash_signature((
+        _get_struct_signature(material, memo, 0, IGNORED_ID_PROPERTIES),
+        node_tree_hash
+    ))
+    memo[material] = ret
+    return ret
+
+
+def get_modifiers_hash(obj: bpy.types.Object, memo: typing.Optional[HashMemo] = None) -> str:
+    """Returns hash of types and settings of modifiers of 'obj' in stack order"""
+    if memo is None:
+        memo = {}
+    return hash_signature(tuple(
+        _get_struct_signature(modifier, memo, 0, IGNORED_MODIFIER_PROPERTIES)
+        for modifier in obj.modifiers
+    ))
+
+
+# attribute data type -> (foreach_get key, numpy dtype, components per element)
+ATTRIBUTE_ARRAY_LAYOUTS = {
+    'FLOAT': ("value", numpy.float32, 1),
+    'INT': ("value", numpy.int32, 1),
+    'INT8': ("value", numpy.int32, 1),
+    'BOOLEAN': ("value", bool, 1),
+    'FLOAT2': ("vector", numpy.float32, 2),
+    'INT32_2D': ("value", numpy.int32, 2),
+    'FLOAT_VECTOR': ("vector", numpy.float32, 3),
+    'FLOAT_COLOR': ("color", numpy.float32, 4),
+    'BYTE_COLOR': ("color", numpy.float32, 4),
+    'QUATERNION': ("value", numpy.float32, 4),
+    'FLOAT4X4': ("value", numpy.float32, 16),
+}
+
+
+# (collection name, property name, generic attribute replacing it in Blender 4.0+)
+LEGACY_MESH_ARRAYS = (
+    ("vertices", "bevel_weight", "bevel_weight_vert"),
+    ("edges", "use_seam", ".uv_seam"),
+    ("edges", "use_edge_sharp", "sharp_edge"),
+    ("edges", "crease", "crease_edge"),
+    ("edges", "bevel_weight", "bevel_weight_edge"),
+)
+
+
+def _update_with_array(
+    hash_: "hashlib._Hash",
+    collection: bpy.types.bpy_prop_collection,
+    key: str,
+    dtype: typing.Any,
+    components: int
+) -> None:
+    array = numpy.empty(len(collection) * components, dtype=dtype)
+    collection.foreach_get(key, array)
+    hash_.update(f"{key}:{len(array)}".encode())
+    hash_.update(array)
+
+
+def get_mesh_hash(mesh: bpy.types.Mesh, include_vertex_weights: bool = True) -> str:
+    """Returns hash of geometry and data of 'mesh' that doesn't depend on its name.
+
+    Arrays are read with foreach_get and hashed without conversions. Hashed are vertices, edges,
+    polygons, smooth flags, material indices, UV maps, generic attributes incl. color attributes,
+    seams, sharp edges, creases and bevel weights, custom normals, shape keys and assigned
+    materials. Seams and in Blender versions before 4.0 also sharp edges, creases and bevel
+    weights aren't generic attributes, they are read from MeshEdge and MeshVertex properties.
+    Vertex group weights are read per vertex which is slow, they can be skipped by
+    'include_vertex_weights' if no user has vertex groups.
+    """
+    hash_ = hashlib.blake2b(digest_size=16)
+    _update_with_array(hash_, mesh.vertices, "co", numpy.float32, 3)
+    _update_with_array(hash_, mesh.edges, "vertices", numpy.int32, 2)
+    _update_with_array(hash_, mesh.loops, "vertex_index", numpy.int32, 1)
+    _update_with_array(hash_, mesh.polygons, "loop_start", numpy.int32, 1)
+    _update_with_array(hash_, mesh.polygons, "loop_total", numpy.int32, 1)
+    _update_with_array(hash_, mesh.polygons, "use_smooth", bool, 1)
+    _update_with_array(hash_, mesh.polygons, "material_index", numpy.int32, 1)
+
+    for uv_layer in mesh.uv_layers:
+        hash_.update(f"uv:{uv_layer.name}".encode())
+        _update_with_array(hash_, uv_layer.data, "uv", numpy.float32, 2)
+
+    # mesh.attributes doesn't exist before Blender 2.91
+    attributes = getattr(mesh, "attributes", ())
+    attribute_names = set()
+    # color attributes, custom attributes and since Blender 3.5 UV maps as well, internal
+    # attributes starting with "." are either hashed separately or hold selection
+    for attribute in attributes:
+        attribute_names.add(attribute.name)
+        if attribute.name.startswith("."):
+            continue
+        hash_.update(f"attribute:{attribute.name}:{attribute.domain}:{attribute.data_type}".encode())
+        layout = ATTRIBUTE_ARRAY_LAYOUTS.get(attribute.data_type, None)
+        if layout is not None:
+            _update_with_array(hash_, attribute.data, *layout)
+
+    for collection_name, property_name, attribute_name in LEGACY_MESH_ARRAYS:
+        if attribute_name in attribute_names and not attribute_name.startswith("."):
+            # already hashed as a generic attribute
+            continue
+        item_type = bpy.types.MeshVertex if collection_name == "vertices" else bpy.types.MeshEdge
+        prop = item_type.bl_rna.properties.get(property_name, None)
+        if prop is None:
+            # removed from the API, stored only as the generic attribute
+            continue
+        dtype = bool if prop.type == 'BOOLEAN' else numpy.float32
+        _update_with_array(hash_, getattr(mesh, collection_name), property_name, dtype, 1)
+
+    if not hasattr(mesh, "color_attributes"):
+        # Blender versions before 3.2 keep vertex colors outside of generic attributes
+        for vertex_colors in mesh.vertex_colors:
+            hash_.update(f"vertex_colors:{vertex_colors.name}".encode())
+            _update_with_array(hash_, vertex_colors.data, "color", numpy.float32, 4)
+
+    if mesh.has_custom_normals:
+        if hasattr(mesh, "corner_normals"):
+            # Blender 4.1+
+            _update_with_array(hash_, mesh.corner_normals, "vector", numpy.float32, 3)
+        else:
+            mesh.calc_normals_split()
+            _update_with_array(hash_, mesh.loops, "normal", numpy.float32, 3)
+
+    if mesh.shape_keys is not None:
+        for key_block in mesh.shape_keys.key_blocks:
+            hash_.update(f"shape_key:{key_block.name}:{key_block.relative_key.name}".encode())
+            _update_with_array(hash_, key_block.data, "co", numpy.float32, 3)
+
+    if include_vertex_weights:
+        weights = [
+            (vertex.index, group_element.group, group_element.weight)
+            for vertex in mesh.vertices for group_element in vertex.groups
+        ]
+        hash_.update(repr(weights).encode())
+
+    hash_.update(repr([
+        material.name_full if material is not None else None for material in mesh.materials
+    ]).encode())
+    hash_.update(repr((
+        getattr(mesh, "use_auto_smooth", None),
+        getattr(mesh, "auto_smooth_angle", None)
+    )).encode())
+    return hash_.hexdigest()
+
+
+def _merge_by_hash(
+    data_blocks: typing.Iterable[bpy.types.ID],
+    get_hash: typing.Callable[[bpy.types.ID], str],
+    report: utils.DuplicateCleanupReport
+) -> typing.List[bpy.types.ID]:
+    """Remaps users of data blocks with the same hash to one of them, returns unused data blocks"""
+    groups: typing.Dict[str, typing.List[bpy.types.ID]] = {}
+    for data in data_blocks:
+        groups.setdefault(get_hash(data), []).append(data)
+
+    to_remove = []
+    for group in groups.values():
+        if len(group) < 2:
+            continue
+        # linked data first, then by name so the data block without duplicate suffix is kept
+        group.sort(key=lambda data: (data.library is None, data.name))
+        orig = group[0]
+        for data in group[1:]:
+            if data.library is not None:
+                continue
+            data.user_remap(orig)
+            report.remapped += 1
+            if data.users == 0:
+                to_remove.append(data)
+                report.removed += 1
+
+    return to_remove
+
+
+def remove_duplicate_node_trees_by_structure(
+    filters: typing.Iterable[utils.DuplicateFilter] = ()
+) -> typing.Dict[str, utils.DuplicateCleanupReport]:
+    """Merges node groups and materials with identical structure regardless of their names.
+
+    Node groups are merged first, so materials using merged groups become identical as well.
+    Unused data blocks are removed in one batch at the end. Returns report of counts and
+    timings for node groups and materials.
+    """
+    filters = list(filters)
+    memo: HashMemo = {}
+    reports = {}
+    to_remove = []
+
+    start = time.perf_counter()
+    report = utils.DuplicateCleanupReport("node_groups")
+    to_remove.extend(_merge_by_hash(
+        (node_group for node_group in bpy.data.node_groups
+         if not utils.is_duplicate_filtered(node_group, filters)),
+        lambda node_group: get_node_tree_hash(node_group, memo),
+        report
+    ))
+    report.seconds = time.perf_counter() - start
+    reports[report.data_collection_name] = report
+
+    # hashes of nested trees are still valid, remapped groups have the same hash as originals
+    start = time.perf_counter()
+    report = utils.DuplicateCleanupReport("materials")
+    to_remove.extend(_merge_by_hash(
+        (material for material in bpy.data.materials
+         if not utils.is_duplicate_filtered(material, filters)),
+        lambda material: get_material_hash(material, memo),
+        report
+    ))
+    report.seconds = time.perf_counter() - start
+    reports[report.data_collection_name] = report
+
+    if len(to_remove) > 0:
+        bpy.data.batch_remove(to_remove)
+    for report in reports.values():
+        logger.info(f"Structural duplicate cleanup of {report}")
+
+    return reports
+
+
+def remove_duplicate_meshes(
+    filters: typing.Iterable[utils.DuplicateFilter] = ()
+) -> utils.DuplicateCleanupReport:
+    """Relinks users of meshes with identical geometry to one shared mesh and removes the rest.
+
+    Meshes in edit mode are skipped. Vertex group weights are hashed only for meshes used by
+    objects with vertex groups.
+    """
+    start = time.perf_counter()
+    report = utils.DuplicateCleanupReport("meshes")
+    filters = list(filters)
+
+    meshes_with_vertex_groups = set()
+    for obj in bpy.data.objects:
+        if obj.type == 'MESH' and len(obj.vertex_groups) > 0:
+            meshes_with_vertex_groups.add(obj.data)
+
+    to_remove = _merge_by_hash(
+        (mesh for mesh in bpy.data.meshes
+         if not mesh.is_editmode and not utils.is_duplicate_filtered(mesh, filters)),
+        lambda mesh: get_mesh_hash(mesh, mesh in meshes_with_vertex_groups),
+        report
+    )
+    if len(to_remove) > 0:
+        bpy.data.batch_remove(to_remove)
+
+    report.seconds = time.perf_counter() - start
+    logger.info(f"Geometry duplicate cleanup of {report}")
+    return report
@@ -3,6 +3,7 @@
 
 import bpy
 import numpy
+import typing
 import unittest
 import mathutils
 
@@ -75,6 +76,75 @@ class WorldBoundingBox:
         )
 
 
+def decompose_matrices(
+    matrices: numpy.ndarray
+) -> typing.Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """Decomposes (N, 4, 4) array of affine matrices without shear to (N, 3) arrays of
+    locations, XYZ euler rotations and scales.
+
+    Scales are lengths of the basis columns. Mirroring (negative determinant) is always put
+    into the X scale, which is negated, the Y and Z scales stay positive. Matrix.decompose
+    chooses the negated axis differently, so mirrored matrices get other scales and rotations
+    than from Blender, recomposing them gives the same matrix. Zero length columns get scale 1.
+    """
+    matrices = numpy.asarray(matrices, dtype=numpy.float64).reshape(-1, 4, 4)
+    locations = matrices[:, :3, 3].copy()
+    basis = matrices[:, :3, :3].copy()
+    scales = numpy.linalg.norm(basis, axis=1)
+    # negative determinant means mirroring, we put it into the X scale
+    mirrored = numpy.linalg.det(basis) < 0.0
+    scales[mirrored, 0] *= -1.0
+    scales[scales == 0.0] = 1.0
+    rotations = basis / scales[:, numpy.newaxis, :]
+
+    cos_y = numpy.hypot(rotations[:, 0, 0], rotations[:, 1, 0])
+    gimbal_lock = cos_y < 1e-6
+    eulers = numpy.empty((len(matrices), 3), dtype=numpy.float64)
+    eulers[:, 0] = numpy.where(
+        gimbal_lock,
+        numpy.arctan2(-rotations[:, 1, 2], rotations[:, 1, 1]),
+        numpy.arctan2(rotations[:, 2, 1], rotations[:, 2, 2])
+    )
+    eulers[:, 1] = numpy.arctan2(-rotations[:, 2, 0], cos_y)
+    eulers[:, 2] = numpy.where(
+        gimbal_lock,
+        0.0,
+        numpy.arctan2(rotations[:, 1, 0], rotations[:, 0, 0])
+    )
+    return locations, eulers, scales
+
+
+def rotations_from_z_to_directions(directions: numpy.ndarray) -> numpy.ndarray:
+    """Returns (N, 3, 3) array of the shortest rotations that rotate Z axis to each of
+    (N, 3) unit 'directions', same as Vector((0, 0, 1)).rotation_difference(direction).
+    """
+    directions = numpy.asarray(directions, dtype=numpy.float64).reshape(-1, 3)
+    axes = numpy.stack([
+        -directions[:, 1],
+        directions[:, 0],
+        numpy.zeros(len(directions))
+    ], axis=1)  # cross((0, 0, 1), directions)
+    cos_angles = directions[:, 2]
+
+    cross_matrices = numpy.zeros((len(directions), 3, 3), dtype=numpy.float64)
+    cross_matrices[:, 0, 1] = -axes[:, 2]
+    cross_matrices[:, 0, 2] = axes[:, 1]
+    cross_matrices[:, 1, 0] = axes[:, 2]
+    cross_matrices[:, 1, 2] = -axes[:, 0]
+    cross_matrices[:, 2, 0] = -axes[:, 1]
+    cross_matrices[:, 2, 1] = axes[:, 0]
+
+    opposite = cos_angles < -1.0 + 1e-9
+    factors = numpy.zeros(len(directions), dtype=numpy.float64)
+    factors[~opposite] = 1.0 / (1.0 + cos_angles[~opposite])
+
+    ret = numpy.eye(3)[numpy.newaxis, :, :] + cross_matrices + \
+        (cross_matrices @ cross_matrices) * factors[:, numpy.newaxis, numpy.newaxis]
+    # rotation by 180 degrees around X axis for directions opposite to Z
+    ret[opposite] = numpy.diag((1.0, -1.0, -1.0))
+    return ret
+
+
 def plane_from_points(points):
     assert len(points) == 3
     p1, p2, p3 = points
@@ -145,5 +215,17 @@ class PlaneFittingTest(unittest.TestCase):
         self.assertAlmostEqual(offset, 0)
 
 
+class DecomposeMatricesTest(unittest.TestCase):
+    def test_roundtrip(self):
+        rotation = mathutils.Euler((0.3, -1.2, 2.5), 'XYZ')
+        matrix = mathutils.Matrix.Translation((1, 2, 3)) @ rotation.to_matrix().to_4x4() @ \
+            mathutils.Matrix.Diagonal((2, 3, 4, 1))
+        locations, eulers, scales = decompose_matrices(numpy.array([matrix]))
+        for i in range(3):
+            self.assertAlmostEqual(locations[0][i], (1, 2, 3)[i])
+            self.assertAlmostEqual(eulers[0][i], rotation[i])
+            self.assertAlmostEqual(scales[0][i], (2, 3, 4)[i])
+
+
 if __name__ == "__main__":
     unittest.main()
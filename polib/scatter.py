@@ -0,0 +1,410 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+import bpy
+import math
+import numpy
+import typing
+
+
+if "asset_addon" not in locals():
+    from . import asset_addon
+    from . import linalg
+else:
+    import importlib
+    asset_addon = importlib.reload(asset_addon)
+    linalg = importlib.reload(linalg)
+
+
+class SurfaceTriangles:
+    """World space triangles of ground objects with their sampling probabilities.
+
+    Probability of each triangle is its area, optionally multiplied by the weight of its polygon
+    in the active vertex group, same as calculate_mesh_area(include_weight=True) measures it.
+    Evaluated meshes are sampled, so modifiers of ground objects are taken into account.
+    """
+
+    def __init__(self, ground_objects: typing.Iterable[bpy.types.Object], include_weight: bool = False):
+        vertices = []
+        triangles = []
+        weights = []
+        vertex_offset = 0
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        for obj in ground_objects:
+            if obj.type != 'MESH':
+                continue
+
+            if include_weight and obj.vertex_groups.active is None:
+                # nothing can be scattered on this object
+                continue
+
+            evaluated_obj = obj.evaluated_get(depsgraph)
+            mesh = evaluated_obj.to_mesh()
+            try:
+                mesh.calc_loop_triangles()
+                obj_triangles = numpy.empty(len(mesh.loop_triangles) * 3, dtype=numpy.int32)
+                mesh.loop_triangles.foreach_get("vertices", obj_triangles)
+                obj_triangles = obj_triangles.reshape(-1, 3)
+
+                if include_weight:
+                    polygon_indices = numpy.empty(len(mesh.loop_triangles), dtype=numpy.int32)
+                    mesh.loop_triangles.foreach_get("polygon_index", polygon_indices)
+                    vertex_weights, assigned = asset_addon.get_vertex_group_weights(
+                        mesh, obj.vertex_groups.active.index)
+                    polygon_weights = asset_addon.MeshPolygonArrays(
+                        mesh).calculate_polygon_weights(vertex_weights, assigned)
+                    weights.append(polygon_weights[polygon_indices])
+                else:
+                    weights.append(numpy.ones(len(obj_triangles), dtype=numpy.float64))
+
+                co = numpy.empty(len(mesh.vertices) * 3, dtype=numpy.float32)
+                mesh.vertices.foreach_get("co", co)
+                vertex_count = len(mesh.vertices)
+            finally:
+                evaluated_obj.to_mesh_clear()
+
+            matrix = numpy.array(obj.matrix_world, dtype=numpy.float64)
+            vertices.append(co.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3])
+            triangles.append(obj_triangles + vertex_offset)
+            vertex_offset += vertex_count
+
+        if len(triangles) == 0:
+            self.vertices = numpy.empty((0, 3), dtype=numpy.float64)
+            self.triangles = numpy.empty((0, 3), dtype=numpy.int32)
+            self.normals = numpy.empty((0, 3), dtype=numpy.float64)
+            self.probabilities = numpy.empty(0, dtype=numpy.float64)
+            return
+
+        self.vertices = numpy.concatenate(vertices)
+        self.triangles = numpy.concatenate(triangles)
+        a, b, c = (self.vertices[self.triangles[:, i]] for i in range(3))
+        crosses = numpy.cross(b - a, c - a)
+        lengths = numpy.linalg.norm(crosses, axis=1)
+        self.normals = numpy.divide(
+            crosses,
+            lengths[:, numpy.newaxis],
+            out=numpy.tile((0.0, 0.0, 1.0), (len(crosses), 1)),
+            where=lengths[:, numpy.newaxis] > 0.0
+        )
+        self.probabilities = 0.5 * lengths * numpy.concatenate(weights)
+
+    def get_total_weighted_area(self) -> float:
+        return float(self.probabilities.sum())
+
+    def sample(
+        self,
+        count: int,
+        rng: numpy.random.Generator
+    ) -> typing.Tuple[numpy.ndarray, numpy.ndarray]:
+        """Returns (count, 3) arrays of uniformly distributed points and their surface normals"""
+        cumulative = numpy.cumsum(self.probabilities)
+        if count <= 0 or len(cumulative) == 0 or cumulative[-1] <= 0.0:
+            return numpy.empty((0, 3)), numpy.empty((0, 3))
+
+        triangle_indices = numpy.searchsorted(
+            cumulative, rng.random(count) * cumulative[-1], side="right")
+        triangle_indices = numpy.minimum(triangle_indices, len(cumulative) - 1)
+
+        # uniform barycentric coordinates inside each chosen triangle
+        r1 = numpy.sqrt(rng.random(count))[:, numpy.newaxis]
+        r2 = rng.random(count)[:, numpy.newaxis]
+        triangles = self.triangles[triangle_indices]
+        points = (1.0 - r1) * self.vertices[triangles[:, 0]] + \
+            r1 * (1.0 - r2) * self.vertices[triangles[:, 1]] + \
+            r1 * r2 * self.vertices[triangles[:, 2]]
+
+        return points, self.normals[triangle_indices]
+
+
+def sample_surface_points(
+    ground_objects: typing.Iterable[bpy.types.Object],
+    count: int,
+    seed: int = 0,
+    include_weight: bool = False
+) -> typing.Tuple[numpy.ndarray, numpy.ndarray]:
+    """Samples 'count' points on 'ground_objects' weighted by triangle area and optionally by
+    the active vertex group. Returns (count, 3) arrays of world space points and normals.
+    """
+    surface = SurfaceTriangles(ground_objects, include_weight)
+    return surface.sample(count, numpy.random.default_rng(seed))
+
+
+def get_scatter_matrices(
+    points: numpy.ndarray,
+    normals: numpy.ndarray,
+    rng: numpy.random.Generator,
+    align_to_normal: bool = False,
+    random_rotation: bool = True,
+    scale_range: typing.Tuple[float, float] = (1.0, 1.0)
+) -> numpy.ndarray:
+    """Returns (N, 4, 4) world matrices of instances placed at 'points'.
+
+    Instances are rotated randomly around their Z axis, which is aligned to 'normals' if
+    'align_to_normal' is True, and uniformly scaled by random factor from 'scale_range'.
+    """
+    count = len(points)
+    angles = rng.random(count) * 2.0 * numpy.pi if random_rotation else numpy.zeros(count)
+    cos_angles = numpy.cos(angles)
+    sin_angles = numpy.sin(angles)
+    rotations = numpy.zeros((count, 3, 3), dtype=numpy.float64)
+    rotations[:, 0, 0] = cos_angles
+    rotations[:, 0, 1] = -sin_angles
+    rotations[:, 1, 0] = sin_angles
+    rotations[:, 1, 1] = cos_angles
+    rotations[:, 2, 2] = 1.0
+    if align_to_normal:
+        rotations = linalg.rotations_from_z_to_directions(normals) @ rotations
+
+    scales = rng.uniform(scale_range[0], scale_range[1], count)
+    matrices = numpy.zeros((count, 4, 4), dtype=numpy.float64)
+    matrices[:, :3, :3] = rotations * scales[:, numpy.newaxis, numpy.newaxis]
+    matrices[:, :3, 3] = points
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+def scatter_collection_instances(
+    collection_name: str,
+    target_collection: bpy.types.Collection,
+    ground_objects: typing.Iterable[bpy.types.Object],
+    count: int,
+    seed: int = 0,
+    include_weight: bool = False,
+    align_to_normal: bool = False,
+    random_rotation: bool = True,
+    scale_range: typing.Tuple[float, float] = (1.0, 1.0)
+) -> typing.List[bpy.types.Object]:
+    """Scatters 'count' instances of collection 'collection_name' on 'ground_objects'.
+
+    Points are sampled by sample_surface_points and instances are created in one batch
+    by create_instanced_objects and linked to 'target_collection'.
+    """
+    rng = numpy.random.default_rng(seed)
+    surface = SurfaceTriangles(ground_objects, include_weight)
+    points, normals = surface.sample(count, rng)
+    matrices = get_scatter_matrices(
+        points, normals, rng, align_to_normal, random_rotation, scale_range)
+    return asset_addon.create_instanced_objects(
+        collection_name, target_collection, matrices=matrices)
+
+
+def get_collection_footprint_radius(collection: bpy.types.Collection) -> float:
+    """Returns horizontal radius of 'collection' objects around the origin of its instances.
+
+    Instances are placed by collection.instance_offset, not by the center of the objects, so
+    the radius is the largest horizontal distance of a WorldBoundingBox corner from the offset.
+    Objects of child collections and of nested collection instances are included.
+    """
+    bounding_box = linalg.WorldBoundingBox()
+    for obj in collection.all_objects:
+        bounding_box.extend_by_object(obj)
+
+    if bounding_box.min_x > bounding_box.max_x:
+        # no objects with geometry
+        return 0.0
+
+    offset = collection.instance_offset
+    return max(
+        math.hypot(x - offset.x, y - offset.y)
+        for x in (bounding_box.min_x, bounding_box.max_x)
+        for y in (bounding_box.min_y, bounding_box.max_y)
+    )
+
+
+def _get_cell_keys(cells: numpy.ndarray) -> numpy.ndarray:
+    """Packs (N, 2) integer cell coordinates into (N, ) int64 keys"""
+    return cells[:, 0] * 4294967296 + cells[:, 1]
+
+
+class _SortedCellIndex:
+    """Points sorted by the key of their cell, neighbouring points of many candidates can be
+    looked up at once by binary search.
+    """
+
+    def __init__(self):
+        self.keys = numpy.empty(0, dtype=numpy.int64)
+        self.point_indices = numpy.empty(0, dtype=numpy.int64)
+
+    def add(self, cells: numpy.ndarray, first_point_index: int) -> None:
+        new_keys = _get_cell_keys(cells)
+        order = numpy.argsort(new_keys, kind="stable")
+        new_keys = new_keys[order]
+        positions = numpy.searchsorted(self.keys, new_keys, side="right")
+        self.keys = numpy.insert(self.keys, positions, new_keys)
+        self.point_indices = numpy.insert(self.point_indices, positions, order + first_point_index)
+
+    def find_conflicts(
+        self,
+        candidates: numpy.ndarray,
+        candidate_radii: numpy.ndarray,
+        candidate_cells: numpy.ndarray,
+        points: numpy.ndarray,
+        radii: numpy.ndarray
+    ) -> numpy.ndarray:
+        """Returns boolean mask of 'candidates' closer to any of 'points' than the sum of
+        radii. Only points in the 3x3 neighbourhood of candidate cells are compared.
+        """
+        conflicts = numpy.zeros(len(candidates), dtype=bool)
+        # binary search is much faster for sorted needles, offsetting the cells keeps the order
+        order = numpy.argsort(_get_cell_keys(candidate_cells))
+        # keys of the three cells in one row of the neighbourhood are consecutive
+        for offset_x in (-1, 0, 1):
+            row_keys = _get_cell_keys(candidate_cells + (offset_x, 0))
+            begins = numpy.empty_like(order)
+            ends = numpy.empty_like(order)
+            begins[order] = numpy.searchsorted(self.keys, row_keys[order] - 1, side="left")
+            ends[order] = numpy.searchsorted(self.keys, row_keys[order] + 1, side="right")
+            # only candidates without found conflict and with unvisited points stay active
+            active = numpy.flatnonzero(~conflicts & (begins < ends))
+            while len(active) > 0:
+                others = self.point_indices[begins[active]]
+                distances_squared = numpy.sum((candidates[active] - points[others]) ** 2, axis=1)
+                min_distances = candidate_radii[active] + radii[others]
+                conflicts[active] = distances_squared < min_distances ** 2
+                begins[active] += 1
+                active = active[~conflicts[active] & (begins[active] < ends[active])]
+
+        return conflicts
+
+
+def poisson_disk_sample(
+    surface: SurfaceTriangles,
+    radii: typing.Sequence[float],
+    count: int,
+    rng: numpy.random.Generator,
+    radii_probabilities: typing.Optional[typing.Sequence[float]] = None,
+    batch_size: int = 4096,
+    max_batch_size: int = 65536,
+    min_acceptance_rate: float = 0.001
+) -> typing.Tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+    """Samples at most 'count' points on 'surface' so that no two points are closer than
+    the sum of their radii (blue noise).
+
+    Each point gets one of 'radii', chosen with 'radii_probabilities'. Points are hashed into
+    a grid with cell size of the largest possible distance, so only neighbouring cells are
+    compared. Candidates are sampled in batches, tested against previously accepted points
+    vectorized and only the remaining ones are resolved against each other one by one.
+    The batch grows as the surface fills up and less candidates are accepted, sampling stops
+    when less than 'min_acceptance_rate' of the largest batch is accepted - the surface is
+    considered full.
+
+    Returns (N, 3) arrays of points and normals and (N, ) array of indices into 'radii'.
+    """
+    radii = numpy.asarray(radii, dtype=numpy.float64)
+    assert len(radii) > 0
+    if radii_probabilities is not None:
+        radii_probabilities = numpy.asarray(radii_probabilities, dtype=numpy.float64)
+        radii_probabilities = radii_probabilities / radii_probabilities.sum()
+
+    cell_size = 2.0 * float(radii.max())
+    if cell_size <= 0.0:
+        points, normals = surface.sample(count, rng)
+        return points, normals, rng.choice(len(radii), size=len(points), p=radii_probabilities)
+
+    # the ground is mostly horizontal, we hash cells in XY only and compare distances in 3D
+    cell_index = _SortedCellIndex()
+    points = numpy.empty((0, 3), dtype=numpy.float64)
+    normals = numpy.empty((0, 3), dtype=numpy.float64)
+    point_radii = numpy.empty(0, dtype=numpy.float64)
+    indices = numpy.empty(0, dtype=numpy.int64)
+    while len(points) < count:
+        candidates, candidate_normals = surface.sample(batch_size, rng)
+        if len(candidates) == 0:
+            break
+
+        candidate_indices = rng.choice(len(radii), size=len(candidates), p=radii_probabilities)
+        candidate_radii = radii[candidate_indices]
+        candidate_cells = numpy.floor(candidates[:, :2] / cell_size).astype(numpy.int64)
+        survivors = numpy.flatnonzero(~cell_index.find_conflicts(
+            candidates, candidate_radii, candidate_cells, points, point_radii))
+
+        # resolve conflicts among survivors of this batch, python floats are much faster than
+        # numpy scalars here
+        grid: typing.Dict[typing.Tuple[int, int], typing.List[int]] = {}
+        batch_points = []
+        batch_radii = []
+        accepted = []
+        for i, (x, y, z), radius, (cell_x, cell_y) in zip(
+            survivors.tolist(),
+            candidates[survivors].tolist(),
+            candidate_radii[survivors].tolist(),
+            candidate_cells[survivors].tolist()
+        ):
+            conflict = False
+            for neighbour_x in (cell_x - 1, cell_x, cell_x + 1):
+                for neighbour_y in (cell_y - 1, cell_y, cell_y + 1):
+                    for j in grid.get((neighbour_x, neighbour_y), ()):
+                        other_x, other_y, other_z = batch_points[j]
+                        min_distance = radius + batch_radii[j]
+                        if (x - other_x) ** 2 + (y - other_y) ** 2 + (z - other_z) ** 2 < \
+                                min_distance ** 2:
+                            conflict = True
+                            break
+                    if conflict:
+                        break
+                if conflict:
+                    break
+
+            if conflict:
+                continue
+
+            grid.setdefault((cell_x, cell_y), []).append(len(batch_points))
+            batch_points.append((x, y, z))
+            batch_radii.append(radius)
+            accepted.append(i)
+            if len(points) + len(accepted) >= count:
+                break
+
+        if len(accepted) > 0:
+            cell_index.add(candidate_cells[accepted], len(points))
+            points = numpy.concatenate((points, candidates[accepted]))
+            normals = numpy.concatenate((normals, candidate_normals[accepted]))
+            point_radii = numpy.concatenate((point_radii, candidate_radii[accepted]))
+            indices = numpy.concatenate((indices, candidate_indices[accepted]))
+
+        if len(accepted) < batch_size * min_acceptance_rate:
+            if batch_size >= max_batch_size:
+                break
+            batch_size = min(batch_size * 4, max_batch_size)
+        elif len(accepted) < batch_size // 10:
+            batch_size = min(batch_size * 2, max_batch_size)
+
+    return points, normals, indices
+
+
+def scatter_collection_instances_poisson_disk(
+    collection_names: typing.Sequence[str],
+    target_collection: bpy.types.Collection,
+    ground_objects: typing.Iterable[bpy.types.Object],
+    count: int,
+    seed: int = 0,
+    include_weight: bool = False,
+    spacing: float = 1.0,
+    align_to_normal: bool = False,
+    random_rotation: bool = True
+) -> typing.List[bpy.types.Object]:
+    """Scatters at most 'count' non-overlapping instances of collections 'collection_names'
+    on 'ground_objects'.
+
+    Minimal distance of two instances is the sum of their footprint radii multiplied by
+    'spacing', collections are picked with equal probability.
+    """
+    assert len(collection_names) > 0
+    radii = [
+        get_collection_footprint_radius(bpy.data.collections[name]) * spacing
+        for name in collection_names
+    ]
+
+    rng = numpy.random.default_rng(seed)
+    surface = SurfaceTriangles(ground_objects, include_weight)
+    points, normals, collection_indices = poisson_disk_sample(surface, radii, count, rng)
+    matrices = get_scatter_matrices(points, normals, rng, align_to_normal, random_rotation)
+
+    ret = []
+    for i, collection_name in enumerate(collection_names):
+        mask = collection_indices == i
+        if numpy.any(mask):
+            ret.extend(asset_addon.create_instanced_objects(
+                collection_name, target_collection, matrices=matrices[mask]))
+
+    return ret
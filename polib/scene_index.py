@@ -0,0 +1,599 @@
+#!/usr/bin/python3
+# copyright (c) 2018- polygoniq xyz s.r.o.
+
+import bpy
+import numpy
+import typing
+
+
+if "utils" not in locals():
+    from . import utils
+else:
+    import importlib
+    utils = importlib.reload(utils)
+
+
+class HierarchyIndex:
+    """Snapshot of parent -> children relations of all objects in bpy.data.objects.
+
+    obj.children iterates all objects in the file in Blender, walking many hierarchies through
+    it is quadratic. This index is built in one pass over bpy.data.objects and numbers objects in
+    depth first order (Euler tour). Each object gets an interval [enter, exit) which contains
+    exactly its descendants, that answers ancestor queries in O(1) and subtree queries
+    in O(subtree).
+
+    The index is not kept up to date, it describes objects at the time it was created. Bulk
+    operations create it once per call, query it before they add, remove or reparent objects
+    and drop it afterwards.
+    """
+
+    def __init__(self):
+        self.parents: typing.Dict[bpy.types.Object, typing.Optional[bpy.types.Object]] = {}
+        self.children: typing.Dict[bpy.types.Object, typing.List[bpy.types.Object]] = {}
+        for obj in bpy.data.objects:
+            parent = obj.parent
+            self.parents[obj] = parent
+            if parent is not None:
+                self.children.setdefault(parent, []).append(obj)
+
+        # objects of all hierarchies in depth first order
+        self.order: typing.List[bpy.types.Object] = []
+        self.enter: typing.Dict[bpy.types.Object, int] = {}
+        self.exit: typing.Dict[bpy.types.Object, int] = {}
+        for root, parent in self.parents.items():
+            if parent is not None:
+                continue
+
+            # iterative DFS, hierarchies can be deeper than python recursion limit
+            stack = [(root, False)]
+            while len(stack) > 0:
+                obj, exiting = stack.pop()
+                if exiting:
+                    self.exit[obj] = len(self.order)
+                    continue
+
+                self.enter[obj] = len(self.order)
+                self.order.append(obj)
+                stack.append((obj, True))
+                for child in reversed(self.children.get(obj, [])):
+                    stack.append((child, False))
+
+    def get_parent(self, obj: bpy.types.Object) -> typing.Optional[bpy.types.Object]:
+        return self.parents[obj]
+
+    def get_children(self, obj: bpy.types.Object) -> typing.List[bpy.types.Object]:
+        return list(self.children.get(obj, []))
+
+    def get_ancestors(self, obj: bpy.types.Object) -> typing.List[bpy.types.Object]:
+        """Returns parent of 'obj', the parent's parent, ..."""
+        ret = []
+        current = self.parents[obj]
+        while current is not None:
+            ret.append(current)
+            current = self.parents[current]
+        return ret
+
+    def get_subtree(self, obj: bpy.types.Object) -> typing.List[bpy.types.Object]:
+        """Returns 'obj' and all its descendants in depth first order"""
+        return self.order[self.enter[obj]:self.exit[obj]]
+
+    def is_ancestor(self, ancestor: bpy.types.Object, obj: bpy.types.Object) -> bool:
+        return self.enter[ancestor] < self.enter[obj] and self.exit[obj] <= self.exit[ancestor]
+
+    def filter_roots(self, objects: typing.Iterable[bpy.types.Object]) -> typing.Set[bpy.types.Object]:
+        """Returns objects from 'objects' that have no ancestor contained in 'objects'"""
+        ret = set()
+        current_root_exit = -1
+        for obj in sorted(set(objects), key=lambda obj: self.enter[obj]):
+            if self.enter[obj] < current_root_exit:
+                # obj is in the subtree of the last root
+                continue
+
+            ret.add(obj)
+            current_root_exit = self.exit[obj]
+
+        return ret
+
+
+class CollectionClassificationCache:
+    """Caches classification of collections instanced by linked polygoniq assets.
+
+    For each collection we remember names of polygoniq addons its objects (or objects of
+    collections instanced by them) belong to. Thousands of instances of the same asset then share
+    one classification instead of rescanning instance_collection.objects recursively for each
+    of them.
+
+    Entries are invalidated when depsgraph reports an update of the collection, of a collection
+    instanced inside it or of an object inside it. Entries are also verified by the count of
+    objects in the collection on each lookup, that catches objects linked or unlinked in the
+    middle of an operator. Custom properties written from python never reach the depsgraph,
+    code writing 'polygoniq_addon' has to call 'invalidate_object' (see update_object_properties).
+    """
+
+    def __init__(self):
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        # collection -> (count of objects, addon names)
+        self.addon_names: typing.Dict[
+            bpy.types.Collection, typing.Tuple[int, typing.FrozenSet[str]]] = {}
+        # instanced collection -> collections whose classification depends on it
+        self.dependents: typing.Dict[bpy.types.Collection, typing.Set[bpy.types.Collection]] = {}
+        # object -> cached collections containing it
+        self.object_collections: typing.Dict[bpy.types.Object, typing.Set[bpy.types.Collection]] = {}
+
+    def invalidate_collection(self, collection: bpy.types.Collection) -> None:
+        stack = [collection]
+        while len(stack) > 0:
+            current = stack.pop()
+            self.addon_names.pop(current, None)
+            stack.extend(self.dependents.pop(current, ()))
+
+    def invalidate_object(self, obj: bpy.types.Object) -> None:
+        """Invalidates collections containing 'obj', call it after changing its properties"""
+        for collection in self.object_collections.get(obj, ()):
+            self.invalidate_collection(collection)
+
+    def track_objects(self, collection: bpy.types.Collection) -> None:
+        for obj in collection.objects:
+            self.object_collections.setdefault(obj, set()).add(collection)
+
+    def get_addon_names(self, collection: bpy.types.Collection) -> typing.FrozenSet[str]:
+        """Returns names of polygoniq addons objects in 'collection' belong to. Objects without
+        the 'polygoniq_addon' property are classified by the collection they instance.
+        """
+        entry = self.addon_names.get(collection, None)
+        if entry is not None:
+            object_count, addon_names = entry
+            if object_count == len(collection.objects):
+                return addon_names
+            self.invalidate_collection(collection)
+
+        self.track_objects(collection)
+        found_addon_names = set()
+        for obj in collection.objects:
+            addon_name = obj.get("polygoniq_addon", None)
+            if addon_name is not None:
+                found_addon_names.add(addon_name)
+            elif obj.instance_collection is not None:
+                self.dependents.setdefault(obj.instance_collection, set()).add(collection)
+                found_addon_names.update(self.get_addon_names(obj.instance_collection))
+
+        addon_names = frozenset(found_addon_names)
+        self.addon_names[collection] = (len(collection.objects), addon_names)
+        return addon_names
+
+    def on_depsgraph_update(self, depsgraph: bpy.types.Depsgraph) -> None:
+        for update in depsgraph.updates:
+            if isinstance(update.id, bpy.types.Collection):
+                self.invalidate_collection(update.id.original)
+            elif isinstance(update.id, bpy.types.Object):
+                self.invalidate_object(update.id.original)
+
+
+def get_object_uids() -> numpy.ndarray:
+    """Returns sorted identifiers of all objects in bpy.data.objects.
+
+    Objects added in place of removed ones get new session_uid, so unlike the count of objects the
+    identifiers change whenever the set of objects changes. Object pointers are used in Blender
+    versions that don't expose session_uid.
+    """
+    objects = bpy.data.objects
+    if "session_uid" in bpy.types.ID.bl_rna.properties:
+        uids = numpy.empty(len(objects), dtype=numpy.int32)
+        objects.foreach_get("session_uid", uids)
+    else:
+        uids = numpy.fromiter((obj.as_pointer() for obj in objects), dtype=numpy.uint64)
+
+    uids.sort()
+    return uids
+
+
+POLYGONIQ_PROPERTIES = ("polygoniq_addon", "polygoniq_addon_blend_path", "copyright")
+# key of ObjectPropertyIndex under which objects are indexed by their instance_collection
+INSTANCE_COLLECTION_KEY = "instance_collection"
+
+
+class ObjectPropertyIndex:
+    """Index from values of custom properties to objects in bpy.data.objects.
+
+    Besides 'property_names' objects are indexed by their instance_collection under
+    INSTANCE_COLLECTION_KEY. Added or removed objects are detected on each query by comparing
+    identifiers of all objects (get_object_uids) and cause a rebuild. Changes of existing objects
+    are picked up from depsgraph updates, returned objects are verified against their current
+    values, so stale entries are never returned.
+
+    Custom properties written from python never reach the depsgraph, every code that writes
+    any of 'property_names' has to pass the object to 'update_object' right after the write,
+    otherwise the object can be missing in query results until the next rebuild.
+    """
+
+    def __init__(self, property_names: typing.Iterable[str]):
+        self.property_names = tuple(property_names)
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        # key -> value -> objects
+        self.objects_by_value: typing.Optional[
+            typing.Dict[str, typing.Dict[typing.Hashable, typing.Set[bpy.types.Object]]]] = None
+        self.object_values: typing.Dict[bpy.types.Object, typing.Dict[str, typing.Hashable]] = {}
+        self.object_uids: typing.Optional[numpy.ndarray] = None
+
+    def read_values(self, obj: bpy.types.Object) -> typing.Dict[str, typing.Hashable]:
+        ret = {}
+        for property_name in self.property_names:
+            value = obj.get(property_name, None)
+            if value is not None and isinstance(value, typing.Hashable):
+                ret[property_name] = value
+
+        if obj.instance_collection is not None:
+            ret[INSTANCE_COLLECTION_KEY] = obj.instance_collection
+
+        return ret
+
+    def ensure_built(self) -> None:
+        object_uids = get_object_uids()
+        if self.objects_by_value is not None and \
+                numpy.array_equal(self.object_uids, object_uids):
+            return
+
+        self.objects_by_value = {key: {} for key in self.property_names}
+        self.objects_by_value[INSTANCE_COLLECTION_KEY] = {}
+        self.object_values = {}
+        for obj in bpy.data.objects:
+            self.add_object(obj)
+
+        self.object_uids = object_uids
+
+    def add_object(self, obj: bpy.types.Object) -> None:
+        values = self.read_values(obj)
+        self.object_values[obj] = values
+        for key, value in values.items():
+            self.objects_by_value[key].setdefault(value, set()).add(obj)
+
+    def remove_object(self, obj: bpy.types.Object) -> None:
+        for key, value in self.object_values.pop(obj, {}).items():
+            self.objects_by_value[key][value].discard(obj)
+
+    def update_object(self, obj: bpy.types.Object) -> None:
+        """Reindexes 'obj', call it after writing any of the indexed properties from python"""
+        if self.objects_by_value is None:
+            return
+
+        self.remove_object(obj)
+        self.add_object(obj)
+
+    def get_objects(self, key: str, value: typing.Hashable) -> typing.List[bpy.types.Object]:
+        """Returns objects whose property 'key' has 'value'"""
+        self.ensure_built()
+        ret = []
+        for obj in list(self.objects_by_value[key].get(value, ())):
+            try:
+                current_values = self.read_values(obj)
+            except ReferenceError:
+                # object was removed and a different one was added since the index was built
+                self.remove_object(obj)
+                continue
+
+            if current_values.get(key, None) != value:
+                self.update_object(obj)
+                continue
+
+            ret.append(obj)
+
+        return ret
+
+    def get_values(self, key: str) -> typing.List[typing.Hashable]:
+        """Returns all values of property 'key' that at least one object has"""
+        self.ensure_built()
+        return [value for value, objects in self.objects_by_value[key].items() if len(objects) > 0]
+
+    def on_depsgraph_update(self, depsgraph: bpy.types.Depsgraph) -> None:
+        if self.objects_by_value is None:
+            return
+
+        for update in depsgraph.updates:
+            if isinstance(update.id, bpy.types.Object):
+                obj = update.id.original
+                if obj in self.object_values:
+                    self.update_object(obj)
+
+
+CollectionPath = typing.Tuple[bpy.types.Collection, ...]
+
+
+class CollectionIndex:
+    """Index of collection trees by collection names without duplicate suffix and of layer
+    collection trees by their collections.
+
+    For each indexed collection the path of collections from the root of the tree is stored.
+    Found entries are verified by checking that each collection on the path is still a child of
+    the previous one, layer collections are resolved from the given root by names on the path
+    on each query, so no LayerCollection is kept. Each tree is indexed on first query in one pass,
+    stale entries and misses rebuild it once. The whole index is dropped when depsgraph reports
+    a change of any collection or scene.
+    """
+
+    def __init__(self):
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        # root collection -> name without duplicate suffix -> path to the first collection
+        # in the tree with that name
+        self.collections: typing.Dict[
+            bpy.types.Collection, typing.Dict[str, CollectionPath]] = {}
+        # collection of the root layer collection -> collection -> path to its layer collection,
+        # view layers of a scene share the same tree
+        self.layer_collections: typing.Dict[
+            bpy.types.Collection, typing.Dict[bpy.types.Collection, CollectionPath]] = {}
+
+    def build_paths(
+        self,
+        root: bpy.types.Collection
+    ) -> typing.Dict[bpy.types.Collection, CollectionPath]:
+        """Returns path from 'root' to each collection in its tree in depth first order"""
+        paths = {}
+        # depth first order, same as asset_addon.get_hierarchy
+        stack = [(root, ())]
+        while len(stack) > 0:
+            collection, path = stack.pop()
+            paths.setdefault(collection, path)
+            for child in reversed(collection.children):
+                stack.append((child, path + (child,)))
+
+        return paths
+
+    def is_path_valid(self, root: bpy.types.Collection, path: CollectionPath) -> bool:
+        parent = root
+        try:
+            for collection in path:
+                if parent.children.get(collection.name, None) != collection:
+                    return False
+                parent = collection
+        except ReferenceError:
+            return False
+
+        return True
+
+    def build_collections(self, root: bpy.types.Collection) -> typing.Dict[str, CollectionPath]:
+        names = {}
+        for collection, path in self.build_paths(root).items():
+            names.setdefault(utils.remove_object_duplicate_suffix(collection.name), path)
+
+        self.collections[root] = names
+        return names
+
+    def get_collection(
+        self,
+        root: bpy.types.Collection,
+        name: str
+    ) -> typing.Optional[bpy.types.Collection]:
+        """Returns first collection in the 'root' tree whose name without suffix is 'name'"""
+        names = self.collections.get(root, None)
+        if names is not None:
+            path = names.get(name, None)
+            if path is not None and self.is_path_valid(root, path):
+                collection = path[-1] if len(path) > 0 else root
+                if utils.remove_object_duplicate_suffix(collection.name) == name:
+                    return collection
+
+        # not indexed yet, stale or a miss, collections could be added in the middle of an operator
+        path = self.build_collections(root).get(name, None)
+        if path is None:
+            return None
+        return path[-1] if len(path) > 0 else root
+
+    def add_collection(
+        self,
+        root: bpy.types.Collection,
+        collection: bpy.types.Collection,
+        parent: typing.Optional[bpy.types.Collection] = None
+    ) -> None:
+        """Adds 'collection' that was just linked to 'parent' in the 'root' tree, 'root' itself
+        if 'parent' is None.
+        """
+        names = self.collections.get(root, None)
+        if names is None:
+            return
+
+        if parent is None or parent == root:
+            parent_path = ()
+        else:
+            parent_path = names.get(utils.remove_object_duplicate_suffix(parent.name), None)
+            if parent_path is None or len(parent_path) == 0 or parent_path[-1] != parent:
+                # path to the parent isn't known, the tree is indexed again on next query
+                del self.collections[root]
+                return
+
+        names.setdefault(
+            utils.remove_object_duplicate_suffix(collection.name), parent_path + (collection,))
+
+    def resolve_layer_collection(
+        self,
+        root: bpy.types.LayerCollection,
+        path: CollectionPath
+    ) -> typing.Optional[bpy.types.LayerCollection]:
+        layer_collection = root
+        try:
+            for collection in path:
+                layer_collection = layer_collection.children.get(collection.name, None)
+                if layer_collection is None:
+                    return None
+        except ReferenceError:
+            return None
+
+        return layer_collection
+
+    def get_layer_collection(
+        self,
+        root: bpy.types.LayerCollection,
+        collection: bpy.types.Collection
+    ) -> typing.Optional[bpy.types.LayerCollection]:
+        paths = self.layer_collections.get(root.collection, None)
+        if paths is not None:
+            path = paths.get(collection, None)
+            if path is not None:
+                layer_collection = self.resolve_layer_collection(root, path)
+                if layer_collection is not None and layer_collection.collection == collection:
+                    return layer_collection
+
+        # not indexed yet, stale or not in the tree at all
+        paths = self.build_paths(root.collection)
+        self.layer_collections[root.collection] = paths
+        path = paths.get(collection, None)
+        if path is None:
+            return None
+        return self.resolve_layer_collection(root, path)
+
+    def on_depsgraph_update(self, depsgraph: bpy.types.Depsgraph) -> None:
+        if len(self.collections) == 0 and len(self.layer_collections) == 0:
+            return
+
+        for update in depsgraph.updates:
+            if isinstance(update.id, (bpy.types.Collection, bpy.types.Scene)):
+                self.invalidate()
+                return
+
+
+def get_material_node_key(node: bpy.types.Node) -> typing.Optional[str]:
+    """Returns name of the node tree for node groups, name of the node otherwise"""
+    if node.type == 'GROUP':
+        return node.node_tree.name if node.node_tree is not None else None
+    return node.name
+
+
+class MaterialNodeIndex:
+    """Index of top level nodes of material node trees by node names and by names of node trees
+    of node groups.
+
+    Only names of nodes are stored, nodes are looked up by name in the node tree on each query,
+    python wrappers of nodes aren't kept as they can outlive the nodes. A material is indexed on
+    first query. Its entry is dropped when depsgraph reports a change of the material, any node
+    tree change drops the whole index as node groups could be renamed. Hits are verified by
+    node count and by looking up each stored name and checking the key of the node found under it,
+    stale entries and misses rebuild the entry of the material once.
+    """
+
+    def __init__(self):
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        # material -> (count of nodes, key -> node names)
+        self.materials: typing.Dict[
+            bpy.types.Material,
+            typing.Tuple[int, typing.Dict[str, typing.List[str]]]
+        ] = {}
+
+    def build_material(self, material: bpy.types.Material) -> typing.Dict[str, typing.List[str]]:
+        node_names = {}
+        if material.node_tree is None:
+            self.materials[material] = (0, node_names)
+            return node_names
+
+        for node in material.node_tree.nodes:
+            key = get_material_node_key(node)
+            if key is not None:
+                node_names.setdefault(key, []).append(node.name)
+
+        self.materials[material] = (len(material.node_tree.nodes), node_names)
+        return node_names
+
+    def find_nodes(
+        self,
+        material: bpy.types.Material,
+        key: str,
+        node_names: typing.Iterable[str]
+    ) -> typing.Optional[typing.List[bpy.types.Node]]:
+        """Returns nodes named 'node_names' if all of them exist and have 'key', None otherwise"""
+        ret = []
+        for node_name in node_names:
+            node = material.node_tree.nodes.get(node_name, None)
+            if node is None or get_material_node_key(node) != key:
+                return None
+            ret.append(node)
+
+        return ret
+
+    def get_nodes(self, material: bpy.types.Material, key: str) -> typing.List[bpy.types.Node]:
+        """Returns top level nodes of 'material' named 'key' or node groups of node tree 'key'"""
+        entry = self.materials.get(material, None)
+        if entry is not None:
+            node_count, node_names = entry
+            try:
+                node_tree = material.node_tree
+                if (0 if node_tree is None else len(node_tree.nodes)) == node_count:
+                    nodes = self.find_nodes(material, key, node_names.get(key, []))
+                    # a miss can be a node renamed to 'key' without a depsgraph update, rebuild
+                    if nodes is not None and len(nodes) > 0:
+                        return nodes
+            except ReferenceError:
+                pass
+
+        # freshly built names always resolve
+        return self.find_nodes(material, key, self.build_material(material).get(key, []))
+
+    def on_depsgraph_update(self, depsgraph: bpy.types.Depsgraph) -> None:
+        if len(self.materials) == 0:
+            return
+
+        for update in depsgraph.updates:
+            if isinstance(update.id, bpy.types.NodeTree):
+                self.invalidate()
+                return
+            elif isinstance(update.id, bpy.types.Material):
+                self.materials.pop(update.id.original, None)
+
+
+collection_classification_cache = CollectionClassificationCache()
+polygoniq_property_index = ObjectPropertyIndex(POLYGONIQ_PROPERTIES)
+collection_index = CollectionIndex()
+material_node_index = MaterialNodeIndex()
+
+
+def update_object_properties(obj: bpy.types.Object) -> None:
+    """Updates indices after polygoniq custom properties of 'obj' were written from python,
+    such writes never reach the depsgraph.
+    """
+    polygoniq_property_index.update_object(obj)
+    collection_classification_cache.invalidate_object(obj)
+
+
+def invalidate_all() -> None:
+    collection_classification_cache.invalidate()
+    polygoniq_property_index.invalidate()
+    collection_index.invalidate()
+    material_node_index.invalidate()
+
+
+@bpy.app.handlers.persistent
+def scene_index_depsgraph_update_post(scene: bpy.types.Scene, depsgraph=None) -> None:
+    if depsgraph is None:
+        # Blender versions before 2.91 don't pass the depsgraph to handlers
+        invalidate_all()
+        return
+
+    collection_classification_cache.on_depsgraph_update(depsgraph)
+    polygoniq_property_index.on_depsgraph_update(depsgraph)
+    collection_index.on_depsgraph_update(depsgraph)
+    material_node_index.on_depsgraph_update(depsgraph)
+
+
+@bpy.app.handlers.persistent
+def scene_index_invalidate_all(*args) -> None:
+    # python references to data blocks are not valid after undo or loading a file
+    invalidate_all()
+
+
+def register():
+    utils.register_handler(bpy.app.handlers.depsgraph_update_post, scene_index_depsgraph_update_post)
+    utils.register_handler(bpy.app.handlers.undo_post, scene_index_invalidate_all)
+    utils.register_handler(bpy.app.handlers.redo_post, scene_index_invalidate_all)
+    utils.register_handler(bpy.app.handlers.load_post, scene_index_invalidate_all)
+
+
+def unregister():
+    utils.unregister_handler(bpy.app.handlers.load_post, scene_index_invalidate_all)
+    utils.unregister_handler(bpy.app.handlers.redo_post, scene_index_invalidate_all)
+    utils.unregister_handler(bpy.app.handlers.undo_post, scene_index_invalidate_all)
+    utils.unregister_handler(bpy.app.handlers.depsgraph_update_post, scene_index_depsgraph_update_post)
+    invalidate_all()
@@ -3,14 +3,20 @@
 
 import bpy
 import addon_utils
+import atexit
+import collections
 import datetime
 import functools
+import gzip
 import hashlib
 import json
 import multiprocessing
 import os.path
 import platform
+import queue
 import socket
+import sys
+import time
 import traceback
 import typing
 import uuid
@@ -18,7 +24,7 @@ import enum
 import threading
 
 
-API_VERSION = 2
+API_VERSION = 3
 
 # useful for debugging
 PRINT_MESSAGES = False
@@ -27,7 +33,6 @@ BOOTSTRAPPED = False
 BOOTSTRAP_LOCK = threading.Lock()
 SESSION = None
 MACHINE = None
-MESSAGES = []
 
 
 class VerboseLevel(enum.IntEnum):
@@ -52,8 +57,35 @@ class Session:
         self.start_timestamp = datetime.datetime.utcnow().isoformat()
 
 
+# machine probing results cached on disk are refreshed after this time
+MACHINE_CACHE_MAX_AGE = datetime.timedelta(days=7)
+
+
 class Machine:
-    def __init__(self):
+    def __init__(
+        self,
+        system_info: typing.Optional[typing.Dict[str, typing.Any]] = None,
+        blender_info: typing.Optional[typing.Dict[str, typing.Any]] = None
+    ):
+        """Probes the system and Blender unless the results are given.
+
+        Probing the system can take seconds, e.g. because of slow DNS, see
+        Machine.load_system_info. Blender info has to be gathered on the main thread.
+        """
+        if system_info is None:
+            system_info = Machine.probe_system_info()
+        if blender_info is None:
+            blender_info = Machine.get_blender_info()
+
+        self._uuid = system_info["_uuid"]
+        self.hardware = system_info["hardware"]
+        self.operating_system = system_info["operating_system"]
+        self.networking = system_info["networking"]
+        self.python = system_info["python"]
+        self.blender = blender_info
+
+    @staticmethod
+    def probe_system_info() -> typing.Dict[str, typing.Any]:
         def safe_get(fn, default="N/A"):
             """Run given functor to retrieve data. Catch all exceptions and provide
             a default value in case of failure.
@@ -63,28 +95,60 @@ class Machine:
             except:
                 return default
 
-        self._uuid = uuid.UUID(int=uuid.getnode()).hex
-
-        self.hardware = {
-            "architecture": platform.machine(),
-            "processor": platform.processor(),
-            "cpu_count": multiprocessing.cpu_count(),
-        }
-
-        self.operating_system = (platform.system(), platform.release(), platform.version())
-
-        self.networking = {
-            "hostname": safe_get(lambda: socket.gethostname()),
-            "ip-address": safe_get(lambda: socket.gethostbyname(socket.gethostname())),
-            "has-ipv6": socket.has_ipv6,
+        return {
+            "_uuid": uuid.UUID(int=uuid.getnode()).hex,
+            "hardware": {
+                "architecture": platform.machine(),
+                "processor": platform.processor(),
+                "cpu_count": multiprocessing.cpu_count(),
+            },
+            "operating_system": (platform.system(), platform.release(), platform.version()),
+            "networking": {
+                "hostname": safe_get(lambda: socket.gethostname()),
+                "ip-address": safe_get(lambda: socket.gethostbyname(socket.gethostname())),
+                "has-ipv6": socket.has_ipv6,
+            },
+            "python": {
+                "version": platform.python_version(),
+                "build": platform.python_build(),
+            },
         }
 
-        self.python = {
-            "version": platform.python_version(),
-            "build": platform.python_build(),
-        }
+    @staticmethod
+    def load_system_info(cache_path: typing.Optional[str]) -> typing.Dict[str, typing.Any]:
+        """Returns system info cached in 'cache_path' if it was probed on this machine at most
+        MACHINE_CACHE_MAX_AGE ago, otherwise probes the system and updates the cache.
+        """
+        node = uuid.getnode()
+        if cache_path is not None:
+            try:
+                with open(cache_path, encoding="utf-8") as f:
+                    cached = json.load(f)
+                probed = datetime.datetime.fromisoformat(cached["timestamp"])
+                if cached["node"] == node and \
+                        datetime.datetime.utcnow() - probed < MACHINE_CACHE_MAX_AGE:
+                    return cached["system_info"]
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+
+        system_info = Machine.probe_system_info()
+        if cache_path is not None:
+            try:
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+                with open(cache_path, "w", encoding="utf-8") as f:
+                    json.dump({
+                        "node": node,
+                        "timestamp": datetime.datetime.utcnow().isoformat(),
+                        "system_info": system_info
+                    }, f)
+            except OSError:
+                pass
+
+        return system_info
 
-        self.blender = {
+    @staticmethod
+    def get_blender_info() -> typing.Dict[str, typing.Any]:
+        return {
             "version": bpy.app.version_string,
             "path": bpy.app.binary_path,
             "window_size": Machine.get_blender_window_size(),
@@ -151,6 +215,8 @@ class MessageType:
     WARNING_MESSAGE = "warning_message"
     ERROR_MESSAGE = "error_message"
     DEBUG_MESSAGE = "debug_message"
+    # number of repeats of a deduplicated message, see MessageFilter
+    MESSAGE_REPEATED = "message_repeated"
 
 
 class Message:
@@ -167,6 +233,47 @@ class Message:
         self.product = product
 
 
+class LazyStack:
+    """Code objects and line numbers of the calling stack, formatted only when serialized.
+
+    Capturing is much cheaper than traceback.extract_stack().format() which reads source lines
+    of all frames. Frames themselves aren't kept, so their locals can be freed.
+    """
+
+    def __init__(self, skip: int = 0):
+        frames = []
+        # skip this constructor and 'skip' callers
+        frame = sys._getframe(skip + 1)
+        while frame is not None:
+            frames.append((frame.f_code, frame.f_lineno))
+            frame = frame.f_back
+        frames.reverse()
+        self.frames = frames
+        self._formatted: typing.Optional[typing.List[str]] = None
+
+    def format(self) -> typing.List[str]:
+        """Returns the same lines as traceback.extract_stack().format() would"""
+        if self._formatted is None:
+            self._formatted = traceback.StackSummary.from_list([
+                traceback.FrameSummary(code.co_filename, lineno, code.co_name)
+                for code, lineno in self.frames
+            ]).format()
+        return self._formatted
+
+
+class StackMessageData:
+    """Data of messages with a text and optional stack, serialized as [text] + formatted stack"""
+
+    def __init__(self, text: str, stack: typing.Optional[LazyStack]):
+        self.text = text
+        self.stack = stack
+
+    def to_list(self) -> typing.List[str]:
+        if self.stack is None:
+            return [self.text]
+        return [self.text] + self.stack.format()
+
+
 class PrivateWrapper:
     """Used to wrap private data such as object names in a way that can be recovered
     locally but is hidden when telemetry is sent remotely.
@@ -203,6 +310,9 @@ class TelemetryJSONEncoder(json.JSONEncoder):
         elif isinstance(obj, PrivateWrapper):
             return obj.value
 
+        elif isinstance(obj, StackMessageData):
+            return obj.to_list()
+
         return json.JSONEncoder.default(self, obj)
 
 
@@ -214,26 +324,477 @@ class RemoteTelemetryJSONEncoder(TelemetryJSONEncoder):
         return TelemetryJSONEncoder.default(self, obj)
 
 
-def _log(msg: Message) -> None:
-    global SESSION
+def get_approximate_size(value: typing.Any, depth: int = 0) -> int:
+    """Returns rough size of 'value' serialized to JSON, only strings are measured exactly"""
+    if isinstance(value, str):
+        return len(value) + 2
+    if depth > 8:
+        return 8
+    if isinstance(value, dict):
+        return sum(
+            get_approximate_size(k, depth + 1) + get_approximate_size(v, depth + 1) + 2
+            for k, v in value.items()
+        ) + 2
+    if isinstance(value, LazyStack):
+        # formatted frame has file path, line number, function name and the source line
+        return 150 * len(value.frames)
+    if isinstance(value, (list, tuple)):
+        return sum(get_approximate_size(item, depth + 1) + 1 for item in value) + 2
+    if hasattr(value, "__dict__"):
+        return get_approximate_size(value.__dict__, depth + 1)
+    return 8
+
+
+class MessageBuffer:
+    """Bounded buffer of logged messages.
+
+    Keeps at most 'max_messages' latest messages with approximate total size under 'max_bytes',
+    older messages are dropped and counted per message type. Messages of PINNED_MESSAGE_TYPES
+    are never dropped and don't count into the limits.
+    """
+
+    PINNED_MESSAGE_TYPES = {MessageType.SESSION_STARTED, MessageType.MACHINE_REGISTERED}
+
+    def __init__(self, max_messages: int = 10000, max_bytes: int = 16 * 1024 * 1024):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # (sequence number, message) of pinned messages
+        self.pinned: typing.List[typing.Tuple[int, Message]] = []
+        # (sequence number, message, approximate size), oldest first
+        self.messages: typing.Deque[typing.Tuple[int, Message, int]] = collections.deque()
+        self.total_bytes = 0
+        self.next_sequence_number = 0
+        # message type -> count of dropped messages
+        self.dropped: typing.Dict[str, int] = {}
+
+    def append(self, msg: Message) -> None:
+        size = 0 if msg._type in MessageBuffer.PINNED_MESSAGE_TYPES else get_approximate_size(msg)
+        with self.lock:
+            sequence_number = self.next_sequence_number
+            self.next_sequence_number += 1
+            if msg._type in MessageBuffer.PINNED_MESSAGE_TYPES:
+                self.pinned.append((sequence_number, msg))
+                return
+
+            self.messages.append((sequence_number, msg, size))
+            self.total_bytes += size
+            # the latest message is always kept, even if it alone is over the budget
+            while len(self.messages) > 1 and \
+                    (len(self.messages) > self.max_messages or self.total_bytes > self.max_bytes):
+                _, dropped_msg, dropped_size = self.messages.popleft()
+                self.total_bytes -= dropped_size
+                self.dropped[dropped_msg._type] = self.dropped.get(dropped_msg._type, 0) + 1
+
+    def configure(self, max_messages: int, max_bytes: int) -> None:
+        with self.lock:
+            self.max_messages = max_messages
+            self.max_bytes = max_bytes
+
+    def get_messages(self) -> typing.List[Message]:
+        """Returns pinned and retained messages in the order they were logged"""
+        with self.lock:
+            pinned = list(self.pinned)
+            messages = [(sequence_number, msg) for sequence_number, msg, _ in self.messages]
+        return [msg for _, msg in sorted(pinned + messages, key=lambda item: item[0])]
+
+    def get_dropped_counts(self) -> typing.Dict[str, int]:
+        with self.lock:
+            return dict(self.dropped)
+
+    def __len__(self) -> int:
+        return len(self.pinned) + len(self.messages)
+
+
+MESSAGES = MessageBuffer()
+
+
+class TokenBucket:
+    """Allows bursts of up to 'capacity' events and 'rate' events per second on average"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_time = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_time) * self.rate)
+        self.last_time = now
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+def get_message_fingerprint(msg: Message) -> typing.Optional[typing.Hashable]:
+    """Returns key identifying repeated messages or None if 'msg' isn't deduplicated.
+
+    Messages with text and stack are identified by the text and the code locations of the stack,
+    exceptions by their formatted traceback.
+    """
+    data = msg.data
+    if isinstance(data, StackMessageData):
+        stack = tuple(data.stack.frames) if data.stack is not None else ()
+        return (msg._type, msg.product, data.text, stack)
+    if isinstance(data, list) and all(isinstance(item, str) for item in data):
+        return (msg._type, msg.product, tuple(data))
+    if isinstance(data, dict) and len(data) == 1 and isinstance(data.get("text", None), str):
+        return (msg._type, msg.product, data["text"])
+    return None
+
+
+class RepeatedMessage:
+    """Repeats of a deduplicated message that weren't reported by a summary yet"""
+
+    def __init__(self, msg: Message):
+        self.msg = msg
+        self.repeats = 0
+        self.first_timestamp: typing.Optional[str] = None
+        self.last_timestamp: typing.Optional[str] = None
+        self.last_summary_time = time.monotonic()
+
+    def add_repeat(self, msg: Message) -> None:
+        if self.repeats == 0:
+            self.first_timestamp = msg._timestamp
+        self.last_timestamp = msg._timestamp
+        self.repeats += 1
+
+    def pop_summary(self) -> typing.Optional[Message]:
+        """Returns MESSAGE_REPEATED message reporting repeats since the last summary, None if
+        there were none.
+        """
+        self.last_summary_time = time.monotonic()
+        if self.repeats == 0:
+            return None
+
+        summary = Message(
+            MessageType.MESSAGE_REPEATED,
+            data={
+                "type": self.msg._type,
+                "data": self.msg.data,
+                "first_timestamp": self.msg._timestamp,
+                "repeats": self.repeats,
+                "first_repeat_timestamp": self.first_timestamp,
+                "last_repeat_timestamp": self.last_timestamp,
+            },
+            product=self.msg.product
+        )
+        summary._session_uuid = self.msg._session_uuid
+        self.repeats = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        return summary
+
+
+class MessageFilter:
+    """Deduplicates repeated messages and limits rate of messages per type.
+
+    Repeated message of DEDUPLICATED_MESSAGE_TYPES isn't logged again, repeats are counted and
+    reported by MESSAGE_REPEATED summary messages, so the counts reach persisted telemetry even
+    if the first message was already dropped from MESSAGES. A summary is made at most once per
+    'summary_interval' seconds while the message repeats, when its fingerprint is forgotten and
+    on 'flush'. At most 'max_fingerprints' latest distinct messages are remembered. Other
+    messages pass through a token bucket of their type, messages over the limit are dropped
+    and counted. Pinned message types are never limited.
+    """
+
+    DEDUPLICATED_MESSAGE_TYPES = {
+        MessageType.UNCAUGHT_EXCEPTION,
+        MessageType.WARNING_MESSAGE,
+        MessageType.ERROR_MESSAGE,
+        MessageType.DEBUG_MESSAGE,
+    }
+
+    def __init__(
+        self,
+        rate: float = 10.0,
+        burst: float = 100.0,
+        max_fingerprints: int = 1000,
+        summary_interval: float = 60.0
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_fingerprints = max_fingerprints
+        self.summary_interval = summary_interval
+        self.lock = threading.Lock()
+        # fingerprint -> repeats of the first logged message, least recently repeated first
+        self.fingerprints: typing.OrderedDict[typing.Hashable, RepeatedMessage] = \
+            collections.OrderedDict()
+        self.buckets: typing.Dict[str, TokenBucket] = {}
+        # message type -> count of messages dropped by the rate limit
+        self.rate_limited: typing.Dict[str, int] = {}
+        # summaries waiting to be logged
+        self.summaries: typing.List[Message] = []
+
+    def _add_summary(self, repeated: RepeatedMessage) -> None:
+        summary = repeated.pop_summary()
+        if summary is not None:
+            self.summaries.append(summary)
+
+    def accept(self, msg: Message) -> bool:
+        """Returns whether 'msg' should be logged. Summaries made meanwhile are returned by
+        'pop_summaries'.
+        """
+        if msg._type in MessageBuffer.PINNED_MESSAGE_TYPES:
+            return True
+
+        fingerprint = None
+        if msg._type in MessageFilter.DEDUPLICATED_MESSAGE_TYPES:
+            fingerprint = get_message_fingerprint(msg)
+
+        with self.lock:
+            if fingerprint is not None:
+                repeated = self.fingerprints.get(fingerprint, None)
+                if repeated is not None:
+                    repeated.add_repeat(msg)
+                    self.fingerprints.move_to_end(fingerprint)
+                    if time.monotonic() - repeated.last_summary_time >= self.summary_interval:
+                        self._add_summary(repeated)
+                    return False
+
+            bucket = self.buckets.get(msg._type, None)
+            if bucket is None:
+                bucket = self.buckets[msg._type] = TokenBucket(self.rate, self.burst)
+            if not bucket.take():
+                self.rate_limited[msg._type] = self.rate_limited.get(msg._type, 0) + 1
+                return False
+
+            if fingerprint is not None:
+                self.fingerprints[fingerprint] = RepeatedMessage(msg)
+                if len(self.fingerprints) > self.max_fingerprints:
+                    _, evicted = self.fingerprints.popitem(last=False)
+                    self._add_summary(evicted)
+            return True
+
+    def flush(self) -> None:
+        """Makes summaries of all repeats that weren't reported yet"""
+        with self.lock:
+            for repeated in self.fingerprints.values():
+                self._add_summary(repeated)
+
+    def pop_summaries(self) -> typing.List[Message]:
+        with self.lock:
+            ret = self.summaries
+            self.summaries = []
+            return ret
+
+    def get_rate_limited_counts(self) -> typing.Dict[str, int]:
+        with self.lock:
+            return dict(self.rate_limited)
+
+
+MESSAGE_FILTER = MessageFilter()
+
+
+class JSONLinesSink:
+    """Appends logged messages to a JSON Lines file from a background thread.
+
+    Logging only puts the message into a queue. The thread drains the queue in batches of up to
+    'batch_size' messages, encodes them with TelemetryJSONEncoder as compact JSON, one message
+    per line, and appends each batch with a single write. When the file grows over 'max_bytes'
+    it is rotated to 'path'.1, 'path'.2, ... keeping 'backup_count' old files. If 'compress'
+    is True each batch is appended as a gzip member, concatenated members form a valid gzip file.
+    Private data are written hashed same as in remote telemetry unless 'include_private' is True.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 10 * 1024 * 1024,
+        backup_count: int = 3,
+        compress: bool = False,
+        batch_size: int = 256,
+        include_private: bool = False
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+        self.batch_size = batch_size
+        self.queue: queue.Queue = queue.Queue()
+        self.thread: typing.Optional[threading.Thread] = None
+        encoder_class = TelemetryJSONEncoder if include_private else RemoteTelemetryJSONEncoder
+        self.encoder = encoder_class(separators=(",", ":"))
+
+    def start(self, messages: typing.Iterable[Message] = ()) -> None:
+        """Starts the writing thread, 'messages' logged before the start are written first"""
+        for msg in messages:
+            self.enqueue(msg)
+
+        if self.thread is not None:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.thread = threading.Thread(
+            target=self._run, name="polygoniq telemetry sink", daemon=True)
+        self.thread.start()
+
+    def enqueue(self, msg: Message) -> None:
+        self.queue.put_nowait(msg)
+
+    def stop(self, timeout: typing.Optional[float] = 5.0) -> None:
+        """Writes all queued messages and stops the thread"""
+        if self.thread is None:
+            return
+        self.queue.put_nowait(None)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = None in batch
+            lines = []
+            for msg in batch:
+                if msg is None:
+                    continue
+                try:
+                    lines.append(self.encoder.encode(msg))
+                except Exception as e:
+                    lines.append(self.encoder.encode(
+                        {"__class__": "telemetry.EncodingError", "error": str(e)}))
+
+            if len(lines) > 0:
+                try:
+                    self._write(("\n".join(lines) + "\n").encode("utf-8"))
+                except OSError as e:
+                    # telemetry must never break the addon, the batch is lost
+                    if PRINT_MESSAGES:
+                        print(f"Failed to write telemetry to {self.path}: {e}")
+
+            if stop:
+                return
+
+    def _write(self, data: bytes) -> None:
+        if self.compress:
+            data = gzip.compress(data)
+        with open(self.path, "ab") as f:
+            f.write(data)
+            size = f.tell()
+
+        if size > self.max_bytes:
+            self._rotate()
+
+    def _rotate(self) -> None:
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.isfile(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+SINK: typing.Optional[JSONLinesSink] = None
+
+
+def get_default_sink_path(compress: bool = False) -> str:
+    return os.path.join(
+        bpy.utils.user_resource('CONFIG'),
+        "polygoniq",
+        "telemetry.jsonl.gz" if compress else "telemetry.jsonl"
+    )
+
+
+def start_sink(path: typing.Optional[str] = None, compress: bool = False, **kwargs) -> JSONLinesSink:
+    """Starts writing all logged messages to a JSON Lines file, messages that were already logged
+    are written as well. The default path is in Blender user config directory.
+
+    The sink is opt-in, bootstrap_telemetry doesn't start it and nothing is written to disk
+    unless this is called, e.g. from a debugging preference of an addon.
+    """
+    global SINK
     global MESSAGES
-    global PRINT_MESSAGES
 
-    if SESSION is not None:
-        msg._session_uuid = SESSION._uuid
+    if SINK is not None:
+        return SINK
+
+    if path is None:
+        path = get_default_sink_path(compress)
+    SINK = JSONLinesSink(path, compress=compress, **kwargs)
+    SINK.start(MESSAGES.get_messages())
+    return SINK
+
+
+def stop_sink() -> None:
+    global SINK
+
+    if SINK is not None:
+        # counts of repeated messages would be lost otherwise
+        flush_message_summaries()
+        SINK.stop()
+        SINK = None
+
+
+atexit.register(stop_sink)
+
+
+def _store(msg: Message) -> None:
+    global MESSAGES
+    global PRINT_MESSAGES
+    global SINK
 
     MESSAGES.append(msg)
+    if SINK is not None:
+        SINK.enqueue(msg)
     if PRINT_MESSAGES:
         print(json.dumps(msg, indent=4, sort_keys=True, cls=TelemetryJSONEncoder))
 
 
+def _log(msg: Message) -> None:
+    global SESSION
+    global MESSAGE_FILTER
+
+    if SESSION is not None:
+        msg._session_uuid = SESSION._uuid
+
+    accepted = MESSAGE_FILTER.accept(msg)
+    # summaries of repeated messages bypass the filter
+    for summary in MESSAGE_FILTER.pop_summaries():
+        _store(summary)
+    if accepted:
+        _store(msg)
+
+
+def flush_message_summaries() -> None:
+    """Logs summaries of all repeated messages that weren't reported yet"""
+    global MESSAGE_FILTER
+
+    MESSAGE_FILTER.flush()
+    for summary in MESSAGE_FILTER.pop_summaries():
+        _store(summary)
+
+
 def log_installed_addons() -> None:
-    global MACHINE
-    assert MACHINE is not None, "logging before telemetry has been bootstrapped!"
+    global BOOTSTRAPPED
+    # MACHINE can still be probed in background
+    assert BOOTSTRAPPED, "logging before telemetry has been bootstrapped!"
 
     _log(Message(MessageType.ALL_ADDONS_REPORTED, data=Machine.get_blender_addons(), product="polib"))
 
 
+def _register_machine(
+    blender_info: typing.Dict[str, typing.Any],
+    cache_path: typing.Optional[str]
+) -> None:
+    global MACHINE
+
+    try:
+        system_info = Machine.load_system_info(cache_path)
+    except Exception:
+        system_info = Machine.probe_system_info()
+    MACHINE = Machine(system_info, blender_info)
+    _log(Message(MessageType.MACHINE_REGISTERED, data=MACHINE, product="polib"))
+
+
 def bootstrap_telemetry():
     global BOOTSTRAPPED
     global BOOTSTRAP_LOCK
@@ -251,8 +812,19 @@ def bootstrap_telemetry():
         SESSION = Session()
         _log(Message(MessageType.SESSION_STARTED, data=SESSION, product="polib"))
 
-        MACHINE = Machine()
-        _log(Message(MessageType.MACHINE_REGISTERED, data=MACHINE, product="polib"))
+        # probing the system can spawn subprocesses or wait for DNS, it runs in background and
+        # the machine is registered once it finishes, Blender info has to be read here
+        try:
+            machine_cache_path = os.path.join(
+                bpy.utils.user_resource('CONFIG'), "polygoniq", "telemetry_machine.json")
+        except Exception:
+            machine_cache_path = None
+        threading.Thread(
+            target=_register_machine,
+            args=(Machine.get_blender_info(), machine_cache_path),
+            name="polygoniq telemetry machine probe",
+            daemon=True
+        ).start()
 
         # wait 5 seconds to give all addons time to register
         bpy.app.timers.register(lambda: log_installed_addons(), first_interval=5)
@@ -270,7 +842,18 @@ class TelemetryWrapper:
 
     def dump(self) -> str:
         global MESSAGES
-        return json.dumps(MESSAGES, indent=4, sort_keys=True, cls=TelemetryJSONEncoder)
+        flush_message_summaries()
+        return json.dumps(MESSAGES.get_messages(), indent=4, sort_keys=True, cls=TelemetryJSONEncoder)
+
+    def get_dropped_message_counts(self) -> typing.Dict[str, int]:
+        """Returns counts of messages dropped from the bounded buffer per message type"""
+        global MESSAGES
+        return MESSAGES.get_dropped_counts()
+
+    def get_rate_limited_message_counts(self) -> typing.Dict[str, int]:
+        """Returns counts of messages dropped by the rate limit per message type"""
+        global MESSAGE_FILTER
+        return MESSAGE_FILTER.get_rate_limited_counts()
 
     def report_addon(self, bl_info, init_path: str) -> None:
         data = {}
@@ -301,13 +884,22 @@ class TelemetryWrapper:
                 raise e
         return wrapped
 
+    def _get_stack_message_data(self, message: str, level: VerboseLevel) -> StackMessageData:
+        """Stack of the caller of log_* is captured only if 'level' is enabled by VERBOSE_LEVEL"""
+        global VERBOSE_LEVEL
+
+        if VERBOSE_LEVEL > level:
+            return StackMessageData(message, None)
+        # skip this method, the stack ends in log_* same as traceback.extract_stack() did
+        return StackMessageData(message, LazyStack(skip=1))
+
     def log_warning(self, message: str) -> None:
         global VERBOSE_LEVEL
 
         self.log(
             Message(
                 MessageType.WARNING_MESSAGE,
-                data=[message] + traceback.extract_stack().format(),
+                data=self._get_stack_message_data(message, VerboseLevel.WARNING),
                 product=self.product
             )
         )
@@ -320,7 +912,7 @@ class TelemetryWrapper:
         self.log(
             Message(
                 MessageType.DEBUG_MESSAGE,
-                data=[message] + traceback.extract_stack().format(),
+                data=self._get_stack_message_data(message, VerboseLevel.DEBUG),
                 product=self.product
             )
         )
@@ -333,7 +925,7 @@ class TelemetryWrapper:
         self.log(
             Message(
                 MessageType.ERROR_MESSAGE,
-                data=[message] + traceback.extract_stack().format(),
+                data=self._get_stack_message_data(message, VerboseLevel.ERROR),
                 product=self.product
             )
         )
@@ -7,14 +7,23 @@ import sys
 import shutil
 import os
 import typing
+import collections
 import datetime
 import functools
+import hashlib
+import logging
+import mmap
+import concurrent.futures
 import subprocess
 import time
 import re
+import threading
 import uuid
 
 
+logger = logging.getLogger(__name__)
+
+
 def autodetect_install_path(product: str, init_path: str, install_path_checker: typing.Callable[[str], bool]) -> str:
     big_zip_path = os.path.abspath(os.path.dirname(init_path))
     if install_path_checker(big_zip_path):
@@ -143,9 +152,11 @@ def move_installation(product: str, old_path: str, new_path: str, install_dir_ch
     return new_path
 
 
+DUPLICATE_SUFFIX_PATTERN = re.compile(r"^\.[0-9]{3}$")
+
+
 def contains_object_duplicate_suffix(name: str) -> bool:
-    pattern = re.compile(r"^\.[0-9]{3}$")
-    return pattern.match(name[-4:])
+    return DUPLICATE_SUFFIX_PATTERN.match(name[-4:]) is not None
 
 
 def remove_object_duplicate_suffix(name: str) -> str:
@@ -159,16 +170,38 @@ def remove_object_duplicate_suffix(name: str) -> str:
     return name
 
 
+class UniqueNameAllocator:
+    """Generates unique names in 'container' the same way as generate_unique_name.
+
+    The next free suffix is remembered for each name without suffix, so generating many names
+    with the same base during one batch operation doesn't probe all the taken suffixes again.
+    Each name is still verified against 'container' and against names allocated before, names
+    taken outside of the allocator are skipped.
+    """
+
+    def __init__(self, container: typing.Iterable[typing.Any]):
+        self.container = container
+        # name without suffix -> first suffix that wasn't probed yet, 0 is no suffix
+        self.next_suffixes: typing.Dict[str, int] = {}
+        self.allocated: typing.Set[str] = set()
+
+    def allocate(self, old_name: str) -> str:
+        name_without_suffix = remove_object_duplicate_suffix(old_name)
+        i = self.next_suffixes.get(name_without_suffix, 0)
+        while True:
+            new_name = name_without_suffix if i == 0 else f"{name_without_suffix}.{i:03d}"
+            i += 1
+            if new_name not in self.allocated and new_name not in self.container:
+                break
+
+        self.next_suffixes[name_without_suffix] = i
+        self.allocated.add(new_name)
+        return new_name
+
+
 def generate_unique_name(old_name: str, container: typing.Iterable[typing.Any]) -> str:
     # TODO: Unify this with renderset unique naming generation
-    name_without_suffix = remove_object_duplicate_suffix(old_name)
-    i = 1
-    new_name = name_without_suffix
-    while new_name in container:
-        new_name = f"{name_without_suffix}.{i:03d}"
-        i += 1
-
-    return new_name
+    return UniqueNameAllocator(container).allocate(old_name)
 
 
 DuplicateFilter = typing.Callable[[bpy.types.ID], bool]
@@ -184,95 +217,378 @@ def is_duplicate_filtered(data: bpy.types.ID, filters: typing.Iterable[Duplicate
     return filtered
 
 
-def remove_duplicate_node_groups(filters: typing.Iterable[DuplicateFilter]) -> None:
-    to_remove = []
+# order matters, data blocks are remapped before the data blocks that use them
+DUPLICATE_CLEANUP_ORDER = ("images", "node_groups", "materials", "worlds")
 
-    for node_group in bpy.data.node_groups:
-        if is_duplicate_filtered(node_group, filters):
-            continue
 
-        # ok, so it's a duplicate, let's figure out the "proper" node group
-        orig_node_group_name = remove_object_duplicate_suffix(node_group.name)
-        if orig_node_group_name in bpy.data.node_groups:
-            orig_node_group = bpy.data.node_groups[orig_node_group_name]
-            node_group.user_remap(orig_node_group)
-            if node_group.users == 0:
-                to_remove.append(node_group)
-        else:
-            # the original node group is gone, we should rename this one
-            node_group.name = orig_node_group_name
+class DuplicateCleanupReport:
+    def __init__(self, data_collection_name: str):
+        self.data_collection_name = data_collection_name
+        self.remapped = 0
+        self.renamed = 0
+        self.removed = 0
+        self.seconds = 0.0
 
-    for node_group in to_remove:
-        bpy.data.node_groups.remove(node_group)
+    def __repr__(self) -> str:
+        return f"{self.data_collection_name}: remapped {self.remapped}, renamed {self.renamed}, " \
+            f"removed {self.removed} in {self.seconds * 1000:.2f} ms"
 
 
-def remove_duplicate_materials(filters: typing.Iterable[DuplicateFilter]) -> None:
-    to_remove = []
+def remove_duplicate_data_blocks(
+    filters: typing.Iterable[DuplicateFilter],
+    data_collection_names: typing.Iterable[str] = DUPLICATE_CLEANUP_ORDER
+) -> typing.Dict[str, DuplicateCleanupReport]:
+    """Remaps users of duplicates of data blocks to the "proper" data blocks with the same name
+    without duplicate suffix and removes duplicates that are left without users.
 
-    for obj in bpy.data.objects:
-        for mat_slot in obj.material_slots:
-            material = mat_slot.material
-            if material is None:
+    Each of 'data_collection_names' (attributes of bpy.data) is bucketed by names without
+    duplicate suffix in one pass. If the proper data block doesn't exist, first duplicate is
+    renamed to take its place. All unused duplicates are removed in one batch at the end.
+    Returns report of counts and timings for each data collection.
+    """
+    filters = list(filters)
+    reports = {}
+    to_remove = []
+    for data_collection_name in data_collection_names:
+        start = time.perf_counter()
+        report = DuplicateCleanupReport(data_collection_name)
+        data_collection = getattr(bpy.data, data_collection_name)
+
+        by_name = {}
+        duplicates_by_base_name: typing.Dict[str, typing.List[bpy.types.ID]] = {}
+        for data in data_collection:
+            by_name[data.name] = data
+            if is_duplicate_filtered(data, filters):
                 continue
+            base_name = remove_object_duplicate_suffix(data.name)
+            if base_name != data.name:
+                duplicates_by_base_name.setdefault(base_name, []).append(data)
 
-            if is_duplicate_filtered(material, filters):
-                continue
+        for base_name, duplicates in duplicates_by_base_name.items():
+            orig = by_name.get(base_name, None)
+            if orig is None:
+                # the original data block is gone, we should rename the first duplicate
+                orig = duplicates.pop(0)
+                orig.name = base_name
+                report.renamed += 1
 
-            # ok, so it's a duplicate, let's figure out the "proper" material
-            orig_material_name = remove_object_duplicate_suffix(material.name)
-            if orig_material_name in bpy.data.materials:
-                orig_material = bpy.data.materials[orig_material_name]
-                mat_slot.material = orig_material
-                if material.users == 0:
-                    to_remove.append(material)
-            else:
-                # the original material is gone, we should rename this one
-                material.name = orig_material_name
+            for data in duplicates:
+                data.user_remap(orig)
+                report.remapped += 1
+                if data.users == 0:
+                    to_remove.append(data)
+                    report.removed += 1
 
-    for mat in to_remove:
-        bpy.data.materials.remove(mat)
+        report.seconds = time.perf_counter() - start
+        reports[data_collection_name] = report
 
+    start = time.perf_counter()
+    if len(to_remove) > 0:
+        bpy.data.batch_remove(to_remove)
+    logger.info(f"Removed {len(to_remove)} duplicate data blocks in "
+                f"{(time.perf_counter() - start) * 1000:.2f} ms")
+    for report in reports.values():
+        logger.info(f"Duplicate cleanup of {report}")
+
+    return reports
 
-def remove_duplicate_images(filters: typing.Iterable[DuplicateFilter]) -> None:
-    to_remove = []
 
-    for image in bpy.data.images:
-        if is_duplicate_filtered(image, filters):
+CacheInfo = collections.namedtuple(
+    "CacheInfo", ["hits", "misses", "evictions", "max_size", "size", "memory"])
+
+
+class TTLCache:
+    """Thread safe cache with least recently used eviction and per entry time to live.
+
+    Size of the cache is bounded by count of entries 'max_size' and by 'max_memory', a budget
+    of approximate bytes of values measured by 'get_size'. Entries older than their TTL are
+    treated as missing and purged lazily. None 'ttl', 'max_size' or 'max_memory' means no limit.
+    """
+
+    def __init__(
+        self,
+        max_size: typing.Optional[int] = None,
+        ttl: typing.Optional[float] = None,
+        max_memory: typing.Optional[int] = None,
+        get_size: typing.Callable[[typing.Any], int] = sys.getsizeof
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_memory = max_memory
+        self.get_size = get_size
+        self.lock = threading.RLock()
+        # key -> (value, monotonic time of expiration or None, size), least recently used first
+        self.entries: typing.OrderedDict[
+            typing.Hashable, typing.Tuple[typing.Any, typing.Optional[float], int]
+        ] = collections.OrderedDict()
+        self.memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.next_purge = time.monotonic()
+
+    def get(self, key: typing.Hashable, default: typing.Any = None) -> typing.Any:
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at, _ = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: typing.Hashable, value: typing.Any, ttl: typing.Optional[float] = None) -> None:
+        """Stores 'value' under 'key', 'ttl' overrides the default time to live of the cache"""
+        ttl = self.ttl if ttl is None else ttl
+        now = time.monotonic()
+        size = self.get_size(value) if self.max_memory is not None else 0
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, None if ttl is None else now + ttl, size)
+            self.memory += size
+            if self.ttl is not None and now >= self.next_purge:
+                self._purge_expired(now)
+            while len(self.entries) > 1 and (
+                (self.max_size is not None and len(self.entries) > self.max_size) or
+                (self.max_memory is not None and self.memory > self.max_memory)
+            ):
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def get_or_set(
+        self,
+        key: typing.Hashable,
+        compute: typing.Callable[[], typing.Any],
+        ttl: typing.Optional[float] = None
+    ) -> typing.Any:
+        """Returns cached value of 'key' or stores and returns result of 'compute'.
+
+        'compute' runs outside of the lock, concurrent misses of the same key can compute it
+        more than once.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, key: typing.Hashable) -> bool:
+        """Removes 'key' from the cache, returns whether it was cached"""
+        with self.lock:
+            if key not in self.entries:
+                return False
+            self._remove(key)
+            return True
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.memory = 0
+
+    def info(self) -> CacheInfo:
+        with self.lock:
+            return CacheInfo(
+                self.hits, self.misses, self.evictions, self.max_size, len(self.entries),
+                self.memory)
+
+    def __contains__(self, key: typing.Hashable) -> bool:
+        with self.lock:
+            entry = self.entries.get(key, None)
+            return entry is not None and (entry[1] is None or entry[1] > time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _remove(self, key: typing.Hashable) -> None:
+        _, _, size = self.entries.pop(key)
+        self.memory -= size
+
+    def _purge_expired(self, now: float) -> None:
+        # entries are ordered by use, not by expiration, scan all of them at most once per TTL
+        for key in [key for key, (_, expires_at, _) in self.entries.items()
+                    if expires_at is not None and expires_at <= now]:
+            self._remove(key)
+        self.next_purge = now + self.ttl
+
+
+# (absolute path, modification time, size) -> hex digest of the file content, the key changes
+# when the file does so entries never expire, the size bounds memory of huge texture libraries
+IMAGE_FILE_HASHES = TTLCache(max_size=100000)
+
+
+def hash_file_content(path: str) -> str:
+    """Returns blake2b hex digest of the file at 'path', the file is read through memory map.
+
+    hashlib releases GIL while hashing large buffers so this can run in parallel in threads.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.blake2b().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.blake2b(mapped).hexdigest()
+
+
+def get_image_file_key(image: bpy.types.Image) -> typing.Optional[typing.Tuple[str, float, int]]:
+    """Returns (absolute path, modification time, size) of the file of not packed 'image'"""
+    if image.packed_file is not None or image.source != 'FILE':
+        return None
+
+    path = os.path.normpath(bpy.path.abspath(image.filepath, library=image.library))
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return path, stat.st_mtime, stat.st_size
+
+
+def get_images_content_hashes(
+    images: typing.Iterable[bpy.types.Image],
+    max_workers: typing.Optional[int] = None
+) -> typing.Dict[bpy.types.Image, str]:
+    """Returns content hashes of 'images' that are packed or are loaded from a single file.
+
+    Packed images are hashed from their packed data, files are hashed in a thread pool and
+    cached by path, modification time and size, so repeated calls don't read them again.
+    Images with unsaved changes (is_dirty) are not hashed, their pixels differ from both
+    the file and the packed data.
+    """
+    ret = {}
+    file_keys = {}
+    for image in images:
+        if image.is_dirty:
             continue
 
-        # ok, so it's a duplicate, let's figure out the "proper" image
-        orig_image_name = remove_object_duplicate_suffix(image.name)
-        if orig_image_name in bpy.data.images:
-            orig_image = bpy.data.images[orig_image_name]
-            image.user_remap(orig_image)
+        if image.packed_file is not None:
+            if image.source == 'FILE':
+                ret[image] = hashlib.blake2b(image.packed_file.data).hexdigest()
+            continue
+
+        file_key = get_image_file_key(image)
+        if file_key is not None:
+            file_keys[image] = file_key
+
+    # read the cache once, entries could be evicted while hashing
+    digests = {}
+    for file_key in set(file_keys.values()):
+        digest = IMAGE_FILE_HASHES.get(file_key, None)
+        if digest is not None:
+            digests[file_key] = digest
+
+    to_hash = [key for key in set(file_keys.values()) if key not in digests]
+    if len(to_hash) > 0:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(hash_file_content, key[0]): key for key in to_hash}
+            for future in concurrent.futures.as_completed(futures):
+                file_key = futures[future]
+                try:
+                    digests[file_key] = future.result()
+                except OSError as e:
+                    logger.warning(f"Failed to hash image file {file_key[0]}: {e}")
+                    continue
+                IMAGE_FILE_HASHES.set(file_key, digests[file_key])
+
+    for image, file_key in file_keys.items():
+        digest = digests.get(file_key, None)
+        if digest is not None:
+            ret[image] = digest
+
+    return ret
+
+
+def remove_duplicate_images_by_content(
+    filters: typing.Iterable[DuplicateFilter] = (),
+    max_workers: typing.Optional[int] = None
+) -> DuplicateCleanupReport:
+    """Remaps users of images with identical content to one of them and removes the rest.
+
+    Images are considered identical if their files or packed data have the same hash and they
+    have the same source, color space and alpha mode. Images with unsaved changes are skipped.
+    Linked images are never removed, they are preferred as the image to keep.
+    """
+    start = time.perf_counter()
+    report = DuplicateCleanupReport("images")
+    filters = list(filters)
+    images = [image for image in bpy.data.images if not is_duplicate_filtered(image, filters)]
+    hashes = get_images_content_hashes(images, max_workers)
+
+    groups: typing.Dict[typing.Tuple[str, str, str, str], typing.List[bpy.types.Image]] = {}
+    for image in images:
+        digest = hashes.get(image, None)
+        if digest is None:
+            continue
+        key = (digest, image.source, image.colorspace_settings.name, image.alpha_mode)
+        groups.setdefault(key, []).append(image)
+
+    to_remove = []
+    for group in groups.values():
+        if len(group) < 2:
+            continue
+        # linked images first, then by name so the image without duplicate suffix is kept
+        group.sort(key=lambda image: (image.library is None, image.name))
+        orig = group[0]
+        for image in group[1:]:
+            if image.library is not None:
+                continue
+            image.user_remap(orig)
+            report.remapped += 1
             if image.users == 0:
                 to_remove.append(image)
-        else:
-            # the original image is gone, we should rename this one
-            image.name = orig_image_name
 
-    for image in to_remove:
-        bpy.data.images.remove(image)
+    if len(to_remove) > 0:
+        bpy.data.batch_remove(to_remove)
+    report.removed = len(to_remove)
+    report.seconds = time.perf_counter() - start
+    logger.info(f"Content duplicate cleanup of {report}")
+    return report
+
+
+def remove_duplicate_node_groups(filters: typing.Iterable[DuplicateFilter]) -> None:
+    remove_duplicate_data_blocks(filters, ("node_groups", ))
+
+
+def remove_duplicate_materials(filters: typing.Iterable[DuplicateFilter]) -> None:
+    remove_duplicate_data_blocks(filters, ("materials", ))
+
+
+def remove_duplicate_images(filters: typing.Iterable[DuplicateFilter]) -> None:
+    remove_duplicate_data_blocks(filters, ("images", ))
 
 
 def remove_duplicate_worlds(filters: typing.Iterable[DuplicateFilter]) -> None:
-    to_remove = []
+    remove_duplicate_data_blocks(filters, ("worlds", ))
 
-    for world in bpy.data.worlds:
-        if is_duplicate_filtered(world, filters):
-            continue
 
-        orig_world_name = remove_object_duplicate_suffix(world.name)
-        if orig_world_name in bpy.data.worlds:
-            orig_world = bpy.data.worlds[orig_world_name]
-            world.user_remap(orig_world)
-            if world.users == 0:
-                to_remove.append(world)
-        else:
-            world.name = orig_world_name
+def register_handler(handlers: typing.List[typing.Callable], handler: typing.Callable) -> None:
+    """Appends 'handler' to one of the bpy.app.handlers lists.
+
+    Previously registered handler with the same module and name is removed first, so reloading
+    of modules doesn't register the same handler multiple times.
+    """
+    for existing_handler in list(handlers):
+        if getattr(existing_handler, "__module__", None) == handler.__module__ and \
+                getattr(existing_handler, "__qualname__", None) == handler.__qualname__:
+            handlers.remove(existing_handler)
 
-    for world in to_remove:
-        bpy.data.worlds.remove(world)
+    handlers.append(handler)
+
+
+def unregister_handler(handlers: typing.List[typing.Callable], handler: typing.Callable) -> None:
+    """Removes 'handler' and handlers with the same module and name from one of
+    the bpy.app.handlers lists.
+    """
+    for existing_handler in list(handlers):
+        if getattr(existing_handler, "__module__", None) == handler.__module__ and \
+                getattr(existing_handler, "__qualname__", None) == handler.__qualname__:
+            handlers.remove(existing_handler)
 
 
 def blender_cursor(cursor_name: str = 'WAIT'):
@@ -310,20 +626,34 @@ def timeit(fn):
     return timed
 
 
-def timed_cache(**timedelta_kwargs):
+def timed_cache(max_size: typing.Optional[int] = 128, **timedelta_kwargs):
+    """Caches results of the decorated function for the time given by 'timedelta_kwargs'.
+
+    Each result expires on its own, at most 'max_size' least recently used results are kept,
+    128 by default same as in functools.lru_cache. None makes the cache unbounded.
+    The decorated function has cache_clear(), cache_info() and cache_invalidate(*args, **kwargs)
+    similar to functools.lru_cache.
+    """
     def _wrapper(f):
-        update_delta = datetime.timedelta(**timedelta_kwargs)
-        next_update = datetime.datetime.utcnow() + update_delta
-        f = functools.lru_cache(None)(f)
+        cache = TTLCache(
+            max_size=max_size,
+            ttl=datetime.timedelta(**timedelta_kwargs).total_seconds()
+        )
+        kwargs_mark = object()
+
+        def _make_key(args, kwargs):
+            if len(kwargs) == 0:
+                return args
+            return args + (kwargs_mark, ) + tuple(sorted(kwargs.items()))
 
         @functools.wraps(f)
         def _wrapped(*args, **kwargs):
-            nonlocal next_update
-            now = datetime.datetime.utcnow()
-            if now >= next_update:
-                f.cache_clear()
-                next_update = now + update_delta
-            return f(*args, **kwargs)
+            return cache.get_or_set(_make_key(args, kwargs), lambda: f(*args, **kwargs))
+
+        _wrapped.cache = cache
+        _wrapped.cache_clear = cache.clear
+        _wrapped.cache_info = cache.info
+        _wrapped.cache_invalidate = lambda *args, **kwargs: cache.invalidate(_make_key(args, kwargs))
         return _wrapped
     return _wrapper
 